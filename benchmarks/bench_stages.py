@@ -0,0 +1,56 @@
+import pytest
+
+from identifying_high_traffic_time_of_day import define_hour_groups, entries_per_hour_block
+from turnstile.cleaning import basic_df_cleaning, remove_duplicates
+from turnstile.features import prepare_daily_dataset, prepare_datasets, prepare_hourly_dataset
+from turnstile.load import import_mta, mta_to_df
+from turnstile.ranking import rank_stations, select_top_stations
+from turnstile.schema import read_turnstile
+from turnstile.stations import attach_stations, normalize_mta_station_names
+
+pytest.importorskip('pytest_benchmark')
+
+"""
+Wall time and peak memory of every pipeline stage at each scale (see conftest.py).
+"""
+
+def bench_import_mta(run_stage, inputs):
+    run_stage(lambda paths: [import_mta(path) for path in paths], inputs.paths)
+
+@pytest.mark.parametrize('engine', ['pyarrow', 'pandas'])
+def bench_read_turnstile(run_stage, inputs, engine):
+    run_stage(lambda paths: [read_turnstile(path, engine=engine) for path in paths], inputs.paths)
+
+def bench_mta_to_df(run_stage, inputs):
+    run_stage(lambda: mta_to_df(inputs.saturday_list, source=inputs.source))
+
+def bench_basic_df_cleaning(run_stage, inputs):
+    run_stage(basic_df_cleaning, inputs.raw, copy=True)
+
+def bench_remove_duplicates(run_stage, inputs):
+    run_stage(lambda data: remove_duplicates(data, verbose=False), inputs.cleaned)
+
+def bench_station_merge(run_stage, inputs):
+    run_stage(lambda mta: attach_stations(normalize_mta_station_names(mta), inputs.stations), inputs.deduplicated, copy=True)
+
+def bench_prepare_datasets(run_stage, inputs):
+    run_stage(prepare_datasets, inputs.mta_locations)
+
+def bench_prepare_daily_dataset(run_stage, inputs):
+    run_stage(prepare_daily_dataset, inputs.mta_locations)
+
+def bench_prepare_hourly_dataset(run_stage, inputs):
+    run_stage(prepare_hourly_dataset, inputs.mta_locations)
+
+def bench_peak_stations(run_stage, inputs):
+    run_stage(lambda daily: select_top_stations(rank_stations(daily, n=10)), inputs.datasets[0])
+
+def bench_define_hour_groups(run_stage, inputs):
+    #define_hour_groups buckets hours of the day, as entries_per_hour_block passes them
+    hourly = inputs.datasets[1]
+    run_stage(define_hour_groups, hourly.assign(datetime=hourly.datetime.dt.hour), copy=True)
+
+def bench_entries_per_hour_block(run_stage, inputs):
+    daily, hourly = inputs.datasets
+    top_stations = select_top_stations(rank_stations(daily, n=10))
+    run_stage(entries_per_hour_block, hourly, top_stations)
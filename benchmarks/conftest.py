@@ -0,0 +1,107 @@
+import functools
+import os
+import tracemalloc
+
+import pandas as pd
+import pytest
+
+from turnstile.cleaning import basic_df_cleaning, remove_duplicates
+from turnstile.features import prepare_datasets
+from turnstile.fetch import LocalDirectorySource, fetch_weeks
+from turnstile.load import import_mta
+from turnstile.pipeline import load_locations
+from turnstile.schema import concat_weeks
+from turnstile.stations import attach_stations, build_station_dimension, normalize_mta_station_names
+from turnstile.store import week_start
+from turnstile.synthetic import TurnstileGenerator
+
+"""
+Benchmarks of the pipeline stages on synthetic turnstile data (see turnstile.synthetic).
+
+Every stage runs at 1x, 10x and 100x a published week of data (1, 10 and 100 weeks) and records its
+wall time (pytest-benchmark) and the peak memory traced while it runs (extra_info['peak_memory_mb']).
+The inputs of a stage are built once per scale by running the stages before it.
+
+    python -m pytest benchmarks --benchmark-autosave           # save the run under benchmarks/.benchmarks
+    python -m pytest benchmarks --benchmark-compare            # compare with the last saved run
+    TURNSTILE_BENCH_SCALES=1,10 python -m pytest benchmarks    # leave out the 100x runs
+"""
+
+SCALES = [int(scale) for scale in os.environ.get('TURNSTILE_BENCH_SCALES', '1,10,100').split(',')]
+FIRST_SATURDAY = '01/05/2019'
+ROUNDS = 5
+
+def peak_memory_mb(func, *args):
+    """Runs func(*args) once and returns the peak memory traced meanwhile, in megabytes."""
+
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1] / 1024**2
+    finally:
+        tracemalloc.stop()
+
+class StageInputs:
+    """The inputs of every stage for one scale, built on first use from a synthetic week directory."""
+
+    def __init__(self, scale, directory):
+        self.scale = scale
+        self.directory = directory
+        self.saturday_list = pd.date_range(FIRST_SATURDAY, periods=scale, freq='7D').strftime('%m/%d/%Y').tolist()
+        self.source = LocalDirectorySource(directory)
+        TurnstileGenerator().write(directory, self.saturday_list)
+
+    @functools.cached_property
+    def paths(self):
+        paths = fetch_weeks(self.saturday_list, source=self.source)
+        return [paths[saturday] for saturday in self.saturday_list]
+
+    @functools.cached_property
+    def raw(self):
+        return concat_weeks([import_mta(path) for path in self.paths])
+
+    @functools.cached_property
+    def cleaned(self):
+        return basic_df_cleaning(self.raw.copy())
+
+    @functools.cached_property
+    def deduplicated(self):
+        return remove_duplicates(self.cleaned, verbose=False)
+
+    @functools.cached_property
+    def stations(self):
+        return build_station_dimension(load_locations(os.path.join(self.directory, 'Stations.csv')))
+
+    @functools.cached_property
+    def mta_locations(self):
+        return attach_stations(normalize_mta_station_names(self.deduplicated.copy()), self.stations)
+
+    @functools.cached_property
+    def datasets(self):
+        daily, hourly = prepare_datasets(self.mta_locations)
+        return daily.assign(week=week_start(daily.datetime)), hourly
+
+def pytest_generate_tests(metafunc):
+    if 'scale' in metafunc.fixturenames:
+        metafunc.parametrize('scale', SCALES, ids=[f"{scale}x" for scale in SCALES], scope='session')
+
+@pytest.fixture(scope='session')
+def inputs(scale, tmp_path_factory):
+    return StageInputs(scale, str(tmp_path_factory.mktemp(f"turnstile_{scale}x")))
+
+@pytest.fixture
+def run_stage(benchmark, scale):
+    """
+    Returns run(stage, *args), which benchmarks stage(*args) and records its peak memory.
+    With copy=True every round gets its own copy of the args, for stages that change their input.
+    """
+
+    def run(stage, *args, copy=False):
+        def setup():
+            return tuple(arg.copy() for arg in args) if copy else args, {}
+
+        benchmark.extra_info['rows'] = sum(len(arg) for arg in args if hasattr(arg, 'columns'))
+        benchmark.extra_info['peak_memory_mb'] = round(peak_memory_mb(stage, *setup()[0]), 1)
+        return benchmark.pedantic(stage, setup=setup, rounds=max(1, ROUNDS // scale), iterations=1)
+
+    return run
@@ -1,12 +1,9 @@
-import matplotlib.pyplot as plt
-import numpy as np
-import pandas as pd
-import datetime
-import seaborn as sns
-from matplotlib.ticker import ScalarFormatter
-
-%config InlineBackend.figure_format = 'svg'
-%matplotlib inline
+from turnstile.cube import TrafficCube
+from turnstile.devicestore import DeviceStore
+from turnstile.hours import hour_blocks
+from turnstile.instrument import instrumented
+from turnstile.ranking import rank_stations, select_top_stations
+from turnstile.stations import station_subset
 
 """
 This file identifies the best time of day to deploy marketing teams to NYC Subway
@@ -19,49 +16,27 @@ recordings to occur between the standard 4 hour increments. To account for hourl
 variations and daylight savings, grouping hourly data into 3 hour increments
 """
 
-def import_data():
-    mta_daily = pd.read_csv('mta_daily.csv')
-    mta_hourly = pd.read_csv('mta_hourly.csv')
-    return mta_daily, mta_hourly
+@instrumented
+def import_data(stations=None):
+    """
+    Reads the hourly entries from the device store.
+    When stations (station_ids) is given only the slices of the store for those stations are read.
+    """
+    mta_hourly = DeviceStore.open().read(stations)
+    return mta_hourly[['station_id', 'station', 'datetime', 'dow', 'hourly_entries']]
 
+@instrumented
 def top_station_dataset(data, list_of_stop_stations):
-    """Reduces dataset to only the top stations to decrease computation and time needed for executions."""
-    x1, x2, x3, x4, x5, x6, x7, x8, x9 = list_of_stop_stations
-
-    all_days_top_sta = mta_hourly[(mta_hourly.station == x1) |
-                                  (mta_hourly.station == x2) |
-                                  (mta_hourly.station == x3) |
-                                  (mta_hourly.station == x4) |
-                                  (mta_hourly.station == x5) |
-                                  (mta_hourly.station == x6) |
-                                  (mta_hourly.station == x7) |
-                                  (mta_hourly.station == x8) |
-                                  (mta_hourly.station == x9)
-                                 ]
-    return all_days_top_sta
-
-def define_hour_groups(data):
-    for row in data.index:
-        if data.loc[row, 'datetime'] == 0:
-            data.loc[row, 'hour_group'] = 0
-        elif 0 < data.loc[row, 'datetime'] <= 3:
-            data.loc[row, 'hour_group'] = 3
-        elif 3 < data.loc[row, 'datetime']  <= 6:
-            data.loc[row, 'hour_group'] = 6
-        elif 6 < data.loc[row, 'datetime']  <= 9:
-            data.loc[row, 'hour_group'] = 9
-        elif 9 < data.loc[row, 'datetime']  <= 12:
-            data.loc[row, 'hour_group'] = 12
-        elif 12 < data.loc[row, 'datetime'] <= 15:
-            data.loc[row, 'hour_group'] = 15
-        elif 15 < data.loc[row, 'datetime']  <= 18:
-            data.loc[row, 'hour_group'] = 18
-        elif 18 < data.loc[row, 'datetime'] <= 21:
-            data.loc[row, 'hour_group'] = 21
-        elif 21 < data.loc[row, 'datetime'] <= 24:
-            data.loc[row, 'hour_group'] = 24
+    """Reduces dataset to only the top stations (by station_id) to decrease computation and time needed for executions."""
+    return station_subset(data, list_of_stop_stations, column='station_id')
+
+@instrumented
+def define_hour_groups(data, width=3, offset=0, dst_align=None):
+    """Adds an hour_group column bucketing the hour of day held in the datetime column (see turnstile.hours)."""
+    data['hour_group'] = hour_blocks(data['datetime'], width=width, offset=offset, dst_align=dst_align)
     return data
 
+@instrumented
 def entries_per_hour_block(data, top_stations_list):
     """
     Calls helper functions to isolate the dataset to only top stations,
@@ -70,7 +45,7 @@ def entries_per_hour_block(data, top_stations_list):
     """
 
     #isolate dataset to only the top stations
-    all_days_top_sta = top_station_dataset(mta_hourly, all_top_sta)
+    all_days_top_sta = top_station_dataset(data, top_stations_list)
 
     hourly_dow = all_days_top_sta.groupby(['dow', all_days_top_sta.datetime.dt.hour])['hourly_entries'].agg(['mean']).reset_index()
     hourly_dow = hourly_dow.rename(columns={'mean':'hourly_mean'})
@@ -84,39 +59,25 @@ def entries_per_hour_block(data, top_stations_list):
 
     return grp_hourly_dow
 
-mta_daily, mta_hourly = import_data()
-grp_hourly_dow = entries_per_hour_block(all_days_top_sta)
-
-#plot hourly traffic for the busiest days of the week to determine posting times
-days = ['Tuesday', 'Wednesday', 'Thursday', 'Friday']
-peak_days = grp_hourly_dow[(grp_hourly_dow.dow == 'Tuesday') |
-                       (grp_hourly_dow.dow == 'Wednesday') |
-                       (grp_hourly_dow.dow == 'Thursday') |
-                       (grp_hourly_dow.dow == 'Friday')
-                      ]
-plt.figure(figsize=(10,4))
-bar_time = sns.barplot(x=peak_days.hour_group, y = peak_days.entries_per_hour_group, hue=peak_days.dow);
-
+def main():
+    from turnstile.plots import day_by_hour_figure, peak_days_by_hour_figure, render_figures
 
-bar_time.legend(fontsize='10', loc=2)
-bar_time.set_title('High Traffic Station Activity')
-bar_time.set_ylabel('Mean Entries Per 3 Hour Block')
-bar_time.set_xlabel('Ending Hour of 3-Hour Block')
-plt.savefig("Station_Traffic_By_Hour.png")
-sns.set_palette("Set2")
-sns.despine()
+    cube = TrafficCube.load()
 
-plt.savefig("Peak_days_Station_Traffic_By_Hour.png")
+    #the top stations picked in identify_high_traffic_stations
+    all_top_sta = select_top_stations(rank_stations(cube.station_week, n=10))
 
-# Plotting for only Friday for sipmle visualization
-thursday_hours = grp_hourly_dow[(grp_hourly_dow.dow == 'Thursday')]
-plt.figure(figsize=(10,4))
-bar_time = sns.barplot(x=single_day.hour_group, y = single_day.entries_per_hour_group, color='#042263FF');
+    #the station x day of week x hour cube answers this without re-grouping the hourly dataset
+    #(entries_per_hour_block computes the same from the hourly dataset)
+    grp_hourly_dow = cube.hourly_profile(all_top_sta)
 
+    render_figures([
+        #plot hourly traffic for the busiest days of the week to determine posting times
+        peak_days_by_hour_figure(grp_hourly_dow),
 
-bar_time.set_title('Thursday Station Traffic By Hour')
-bar_time.set_ylabel('Mean Hourly Entries')
-bar_time.set_xlabel('Hour of The Day')
-sns.despine()
+        # Plotting for only Thursday for simple visualization
+        day_by_hour_figure(grp_hourly_dow, 'Thursday'),
+    ])
 
-plt.savefig("Thursday_Station_Traffic_By_Hour.png")
+if __name__ == '__main__':
+    main()
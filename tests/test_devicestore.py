@@ -0,0 +1,46 @@
+import shutil
+
+import pandas as pd
+
+from turnstile.devicestore import DeviceStore, append_device_segment, build_device_store
+from turnstile.store import write_table
+
+"""
+A device store appended to week by week against one built from the whole hourly dataset,
+including a turnstile and a station first seen in an appended week.
+"""
+
+def hourly_rows(devices, start, periods):
+    """Every four hours from start for each (station_id, c_a, unit, scp, station) in devices."""
+
+    rows = []
+    for number, (station_id, c_a, unit, scp, station) in enumerate(devices):
+        rows.append(pd.DataFrame({'station_id': station_id, 'c_a': c_a, 'unit': unit, 'scp': scp, 'station': station,
+                                  'borough': 'M', 'datetime': pd.date_range(start, periods=periods, freq='4h'),
+                                  'hourly_entries': range(number, number + periods)}))
+    return pd.concat(rows, ignore_index=True)
+
+def test_appended_segments_match_full_build(tmp_path):
+    devices = [(2, 'A002', 'R051', '02-00-00', '59 ST'), (1, 'A001', 'R050', '01-00-00', '14 ST')]
+    weeks = [hourly_rows(devices, '2019-03-02', 42),
+             hourly_rows(devices + [(1, 'A001', 'R050', '01-00-01', '14 ST')], '2019-03-09', 42),
+             hourly_rows(devices + [(3, 'A003', 'R052', '03-00-00', 'CANAL ST')], '2019-03-16 02:00', 42)]
+
+    appended = str(tmp_path / 'appended')
+    write_table(weeks[0], 'hourly', appended, append=True)
+    build_device_store(appended)
+    for week in weeks[1:]:
+        write_table(week, 'hourly', appended, append=True)
+        append_device_segment(week, appended)
+
+    full = str(tmp_path / 'full')
+    shutil.copytree(appended, full)
+    build_device_store(full)
+
+    appended, full = DeviceStore.open(appended), DeviceStore.open(full)
+    assert len(appended.segments) == 3 and len(full.segments) == 1
+    key = ['station_id', 'c_a', 'unit', 'scp', 'datetime']
+    for query in [{}, {'stations': [1, 3]}, {'stations': [1], 'start': '2019-03-08', 'end': '2019-03-17'}]:
+        expected = full.read(**query).sort_values(key).reset_index(drop=True)
+        pd.testing.assert_frame_equal(appended.read(**query).sort_values(key).reset_index(drop=True), expected)
+        pd.testing.assert_frame_equal(appended.hourly_profile(**query), full.hourly_profile(**query))
@@ -0,0 +1,51 @@
+import os
+
+import pandas as pd
+import pytest
+
+from turnstile.fetch import LocalDirectorySource, all_saturdays, week_key
+from turnstile.parallel import build_parallel
+from turnstile.pipeline import build_full, load_locations
+from turnstile.store import read_table
+from turnstile.synthetic import TurnstileGenerator
+
+"""
+The multi-core build against the full build on synthetic weeks that span the start of daylight
+saving time (2019-03-10), so that days are split across weekly files as in the published data,
+and on weeks whose files repeat the last audit of the file before.
+"""
+
+END_DATE = '03/23/2019'
+SORT_COLS = ['c_a', 'unit', 'scp', 'datetime']
+
+def read_sorted(name, root):
+    data = read_table(name, root)
+    data = data.astype({col: str for col, dtype in data.dtypes.items() if isinstance(dtype, pd.CategoricalDtype)})
+    return data.sort_values(by=SORT_COLS).reset_index(drop=True)
+
+def repeat_last_audits(source_dir, saturday_list):
+    """Adds the last audit of every turnstile in each weekly file to the start of the next file."""
+
+    paths = [os.path.join(source_dir, f"turnstile_{week_key(saturday)}.txt") for saturday in saturday_list]
+    weeks = [pd.read_csv(path, dtype=str) for path in paths]
+    for previous, path, week in zip(weeks, paths[1:], weeks[1:]):
+        last_audits = previous.groupby(['C/A', 'UNIT', 'SCP']).tail(1)
+        pd.concat([last_audits, week]).to_csv(path, index=False)
+
+@pytest.mark.parametrize('start_date, overlapping', [('03/09/2019', False), ('03/12/2019', False), ('03/09/2019', True)])
+def test_parallel_build_matches_full_build(tmp_path, start_date, overlapping):
+    source_dir = str(tmp_path / 'weeks')
+    TurnstileGenerator(n_stations=40).write(source_dir, all_saturdays(start_date, END_DATE))
+    if overlapping:
+        repeat_last_audits(source_dir, all_saturdays(start_date, END_DATE))
+    source = LocalDirectorySource(source_dir)
+    stations_path = os.path.join(source_dir, 'Stations.csv')
+
+    build_full(start_date, END_DATE, root=str(tmp_path / 'full'), stations_path=stations_path, source=source)
+    build_parallel(all_saturdays(start_date, END_DATE), load_locations(stations_path), max_workers=2,
+                   root=str(tmp_path / 'parallel'), source=source, start_date=start_date)
+
+    for name in ['locations', 'daily', 'hourly']:
+        full = read_sorted(name, str(tmp_path / 'full'))
+        parallel = read_sorted(name, str(tmp_path / 'parallel'))[full.columns]
+        pd.testing.assert_frame_equal(parallel, full, check_dtype=False)
@@ -0,0 +1,10 @@
+"""
+Reusable building blocks for the MTA turnstile analysis.
+
+The top-level scripts in this repository walk through the analysis step by step;
+the modules in this package hold the pieces they share. The stages can also be run
+without prompts from the command line: python -m turnstile --help (see turnstile.cli).
+
+The package needs pandas, NumPy and pyarrow (the Parquet store, the CSV reader and the Arrow
+streams of the parallel build); matplotlib and seaborn are only needed to draw the plots.
+"""
@@ -0,0 +1,3 @@
+from turnstile.cli import main
+
+main()
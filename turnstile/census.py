@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from turnstile.instrument import instrumented
+from turnstile.store import STORE_DIR
+
+"""
+Loading and cleaning of the NYC census data used to pick the boroughs to market in.
+
+load_census keeps the cleaned table (one typed row per borough) in a Parquet file named after the
+sha256 of the source CSV, so the CSV is only parsed again when it changes.
+"""
+
+CENSUS_PATH = 'NYC Census Jan-09-2020.csv'
+CENSUS_CACHE_DIR = os.path.join(STORE_DIR, 'census')
+
+# borough codes of the station data, to join the census onto station traffic
+BOROUGH_CODES = {'bronx': 'Bx', 'brooklyn': 'Bk', 'manhattan': 'M', 'queens': 'Q', 'staten_island': 'SI'}
+
+CENSUS_FEATURES = {'Population estimates, July 1, 2018,  (V2018)': 'population',
+                   'Female persons, percent': 'perc_female',
+                   'Households with a broadband Internet subscription, percent, 2014-2018': 'perc_broadband',
+                   'Median household income (in 2018 dollars), 2014-2018': 'income_dol',
+                   'Women-owned firms, 2012': 'womenfirms',
+                   'All firms, 2012': 'allfirms',
+                   'Land area in square miles, 2010': 'area'}
+
+@instrumented
+def import_census_data(path=CENSUS_PATH):
+    return pd.read_csv(path)
+
+@instrumented
+def clean_census_data(data):
+    """
+    Remove Superfluous "Value Note" colums, transpose dataset so that borough represents rows instead
+    of columns, drop null values.
+    """
+
+    ccols = [c for c in data.columns if c.lower()[0:10] != "value note"]
+    data = data[ccols]
+    data.columns = ['borough', np.nan, 'nyc', 'bronx', 'brooklyn',
+                      'manhattan', 'queens', 'staten_island']
+
+    #Transpose dataframe so that boroughs represent rows instead of columns.
+    data = data.set_index('borough').T
+
+    #Drop columns with only empty values
+    data = data.drop(np.nan)
+    data = data.dropna(axis='columns',thresh=2)
+
+    return data
+
+@instrumented
+def census_feature_selection(data):
+    """Select only columns that will be used for analysis and rename columns for easier accessing."""
+
+    data = data[list(CENSUS_FEATURES)]
+    data.columns = list(CENSUS_FEATURES.values())
+
+    return data
+
+@instrumented
+def secondary_census_cleaning(data):
+    """
+    Remove symbols ($, % and thousands separators) from dataset and convert it to numbers in one pass
+    over all the values. Percentages are turned into fractions.
+    """
+
+    values = data.stack()
+    numbers = pd.to_numeric(values.str.replace(r'[$,%]', '', regex=True))
+    numbers = numbers.where(~values.str.endswith('%'), numbers / 100.0)
+    return numbers.unstack().reindex(index=data.index, columns=data.columns).astype('float64')
+
+@instrumented
+def feature_engineering(data):
+    """Create column for percentage of firms owned by women & population per square mile"""
+
+    data['womfirm_percent'] = data['womenfirms']/data['allfirms']
+    data['pop_persqmi'] = data['population']//data['area']
+
+    return data
+
+def census_key(path):
+    """sha256 of the census CSV and of the features kept from it."""
+
+    digest = hashlib.sha256(json.dumps(CENSUS_FEATURES).encode())
+    with open(path, 'rb') as f:
+        digest.update(f.read())
+    return digest.hexdigest()
+
+@instrumented
+def load_census(path=CENSUS_PATH, cache_dir=CENSUS_CACHE_DIR):
+    """
+    Imports the census data and runs every cleaning step above, or reads the result of an earlier
+    run on the same CSV from cache_dir. cache_dir=None always parses the CSV.
+    """
+
+    cache_path = os.path.join(cache_dir, f"census-{census_key(path)[:16]}.parquet") if cache_dir else None
+    if cache_path is not None and os.path.exists(cache_path):
+        return pd.read_parquet(cache_path)
+
+    census = clean_census_data(import_census_data(path))
+    census = census_feature_selection(census)
+    census = secondary_census_cleaning(census)
+    census = feature_engineering(census)
+    census.index.name = 'borough'
+
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        census.to_parquet(f"{cache_path}.{os.getpid()}.tmp")
+        os.replace(f"{cache_path}.{os.getpid()}.tmp", cache_path)
+    return census
+
+def census_densities(census):
+    """
+    Women and firms per square mile of every borough, indexed by the borough codes of the station data
+    (e.g. for data.merge(census_densities(census), left_on='borough', right_index=True)).
+    """
+
+    densities = pd.DataFrame({'women_persqmi': census.population * census.perc_female / census.area,
+                              'firms_persqmi': census.allfirms / census.area,
+                              'womenfirms_persqmi': census.womenfirms / census.area})
+    densities = densities.loc[list(BOROUGH_CODES)].rename(index=BOROUGH_CODES)
+    densities.index.name = 'borough'
+    return densities
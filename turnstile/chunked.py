@@ -0,0 +1,88 @@
+import os
+import shutil
+
+from turnstile.cube import TrafficCube, cube_parts
+from turnstile.devicestore import build_device_store
+from turnstile.features import finish_daily_dataset, finish_hourly_dataset
+from turnstile.ingest import (new_outlier_filters, print_outlier_report, readings_since, record_ingest_state,
+                              save_outlier_report, week_deltas)
+from turnstile.instrument import instrumented, peak_rss_mb
+from turnstile.load import stream_weeks
+from turnstile.outliers import compare_to_exact
+from turnstile.stations import attach_stations, build_station_dimension, normalize_mta_station_names
+from turnstile.store import STORE_DIR, clear_table, list_partitions, read_table, write_table
+
+"""
+Out-of-core build of the store for long date ranges (e.g. 2010 to present).
+
+Only one week of readings is held in memory at a time.
+1. Every week is cleaned, matched to its stations and turned into daily and hourly deltas, with the
+   tail of the previous week carried over for the boundary. The deltas are spilled to disk and
+   added to the outlier sketches.
+2. Once every week has been seen, the spilled deltas are read back one week partition at a time,
+   cut at the final outlier thresholds and written to the store, and the cut is compared with the
+   exact quantiles of that partition for the outlier report. The traffic cubes (including the
+   weekly entries per station that peak_stations ranks on) are aggregated per partition and merged
+   at the end. The device store is then built from the hourly dataset, again one week at a time.
+"""
+
+SPILL_DIR = '_spill'
+
+@instrumented
+def build_chunked(saturday_list, locations, root=STORE_DIR, spill_dir=None, source=None, cache=None, start_date=None):
+    """
+    Builds the locations, daily and hourly datasets of the store for saturday_list one week at a time,
+    plus the traffic cubes. locations must already be cleaned with normalized stop names. Readings
+    before start_date (X/X/XXXX) are left out, as in a full build.
+    """
+
+    spill_dir = spill_dir or os.path.join(root, SPILL_DIR)
+    stations = build_station_dimension(locations)
+    daily_outliers, hourly_outliers = new_outlier_filters()
+
+    # a week's readings can fall in two week partitions, so the datasets are cleared once and appended to
+    shutil.rmtree(spill_dir, ignore_errors=True)
+    for name in ('locations', 'daily', 'hourly'):
+        clear_table(name, root)
+
+    # pass 1: deltas per week, spilled to disk
+    tail = None
+    for saturday, week in stream_weeks(saturday_list, source=source, cache=cache):
+        week = readings_since(week, start_date)
+        if week.empty:
+            continue
+        week = attach_stations(normalize_mta_station_names(week), stations)
+        write_table(week, 'locations', root, append=True)
+
+        daily, hourly, tail = week_deltas(week, tail)
+        write_table(daily, 'daily', spill_dir, append=True)
+        write_table(hourly, 'hourly', spill_dir, append=True)
+        daily_outliers.update(daily)
+        hourly_outliers.update(hourly)
+        del week, daily, hourly
+
+    # pass 2: apply the final outlier thresholds one partition at a time
+    parts = []
+    report = {'daily': {}, 'hourly': {}}
+    for week in list_partitions('daily', spill_dir):
+        daily = read_table('daily', spill_dir, filters=[('week', '=', week)])
+        report['daily'][week] = compare_to_exact(daily, daily_outliers)
+        daily = finish_daily_dataset(daily, daily_outliers, update=False)
+        write_table(daily, 'daily', root, append=True)
+        parts.append(cube_parts(daily=daily))
+
+    for week in list_partitions('hourly', spill_dir):
+        hourly = read_table('hourly', spill_dir, filters=[('week', '=', week)])
+        report['hourly'][week] = compare_to_exact(hourly, hourly_outliers)
+        hourly = finish_hourly_dataset(hourly, hourly_outliers, update=False)
+        write_table(hourly, 'hourly', root, append=True)
+        parts.append(cube_parts(hourly=hourly))
+
+    TrafficCube.from_parts(parts).save(root)
+    build_device_store(root)
+
+    record_ingest_state(saturday_list, tail, daily_outliers, hourly_outliers, root, start_date)
+    save_outlier_report(report, root)
+    print_outlier_report(report, sorted(set(report['daily']) | set(report['hourly'])))
+    shutil.rmtree(spill_dir, ignore_errors=True)
+    print(f"Built {len(saturday_list)} weeks. Peak RSS: {peak_rss_mb():.0f} MB.")
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+
+from turnstile.instrument import instrumented
+
+"""
+Cleaning steps applied to the raw MTA turnstile data.
+"""
+
+DUPLICATE_COLS = ["c_a", "unit", "scp", "station"]
+KEY_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+@instrumented
+def basic_df_cleaning(data):
+    """
+    Replaces all column names with lower case and removes spaces and / symbols.
+    Combines date and time columns into a single datetime column, unless read_turnstile already did.
+    Expects date and time as parsed by read_turnstile (datetime64 and timedelta).
+    """
+
+    data.columns = data.columns.str.strip().str.lower().str.replace('/',"_")
+    if "datetime" not in data.columns:
+        data["datetime"] = data.date + data.time
+    data = data.drop(columns = ['time']) # replaced with datetime above
+
+    return data
+
+def reading_keys(data):
+    """
+    Returns one uint64 key per reading that identifies its turnstile (c_a, unit, scp, station) and datetime.
+    The turnstile part is a hash of the identifiers, computed once per distinct turnstile, so keys
+    of the same reading are equal across chunks.
+    """
+
+    devices = data.groupby(DUPLICATE_COLS, observed=True, sort=False)
+    device_hashes = pd.util.hash_pandas_object(devices.size().index.to_frame(index=False).astype(str), index=False)
+    hashes = device_hashes.to_numpy().take(devices.ngroup().to_numpy())
+    timestamps = data.datetime.to_numpy().astype('datetime64[ns]').astype(np.int64).view(np.uint64)
+    return hashes * KEY_MULTIPLIER + timestamps
+
+class DuplicateFilter:
+    """
+    Remembers the keys of the readings seen in earlier chunks so that a reading repeated in a later
+    chunk is dropped too, and counts the readings dropped. With window set, only keys of readings
+    within window of the newest reading are kept, which is enough for chunks that overlap only at their edges.
+    """
+
+    def __init__(self, window=None):
+        self.window = window
+        self.dropped = 0
+        self.keys = np.empty(0, dtype=np.uint64)
+        self.timestamps = np.empty(0, dtype='datetime64[ns]')
+
+    def seen(self, keys):
+        return np.isin(keys, self.keys)
+
+    def add(self, keys, timestamps):
+        self.keys = np.concatenate([self.keys, keys])
+        self.timestamps = np.concatenate([self.timestamps, np.asarray(timestamps, dtype='datetime64[ns]')])
+        if self.window is not None and len(self.timestamps):
+            recent = self.timestamps >= self.timestamps.max() - pd.Timedelta(self.window).to_timedelta64()
+            self.keys = self.keys[recent]
+            self.timestamps = self.timestamps[recent]
+
+def dedupe_readings(data, seen=None):
+    """
+    Drops repeated readings of a turnstile at the same datetime, hashing a single composite key.
+    When a DuplicateFilter is passed, readings seen in earlier chunks are dropped as well.
+    Returns the de-duplicated data and the number of rows dropped.
+    """
+
+    keys = reading_keys(data)
+    duplicated = pd.Series(keys).duplicated().to_numpy()
+    if seen is not None:
+        duplicated = duplicated | seen.seen(keys)
+        seen.add(keys[~duplicated], data.datetime.to_numpy()[~duplicated])
+        seen.dropped += int(duplicated.sum())
+
+    return data[~duplicated], int(duplicated.sum())
+
+@instrumented
+def remove_duplicates(data, verbose=True, seen=None):
+    """Takes in a dataset and identifies then drops all duplicate rows."""
+
+    data, dropped = dedupe_readings(data, seen)
+    if verbose:
+        print(f"There were {dropped} duplicates in the dataset. All duplicates dropped.")
+
+    return data
@@ -0,0 +1,245 @@
+import argparse
+import os
+import sys
+
+"""
+Command line entry points for the stages of the analysis, for batch jobs and schedulers.
+
+    python -m turnstile ingest START_DATE END_DATE [--mode full|incremental|chunked|parallel]
+    python -m turnstile daily
+    python -m turnstile hourly
+    python -m turnstile rank-stations [-n 10] [--borough M] [--areas GEOJSON --area-property NAME]
+    python -m turnstile near LAT,LON [LAT,LON ...] [--radius 500]
+    python -m turnstile peak-hours [--stations ...] [--days ...] [--start DATE] [--end DATE]
+    python -m turnstile census [--path CSV] [--densities]
+    python -m turnstile report [--out-dir DIR] [--census CSV] [--workers N]
+    python -m turnstile compare-reports OLD.json NEW.json
+
+--report RUN.json (before the command) writes a run report with the wall time, rows, bytes and memory
+of every stage (see turnstile.instrument), and --profile adds a cProfile or pyinstrument dump.
+
+Nothing is prompted for. Each command imports only the modules it needs when it runs (pandas and
+pyarrow included), so the command line starts without loading them, and the plotting stack is
+only loaded with --plot. Tables are written to stdout as CSV.
+"""
+
+STORE_DIR = 'mta_store'  # the default of turnstile.store, repeated here so that --help does not import pandas
+
+def run_ingest(args):
+    from turnstile.fetch import LocalDirectorySource, all_saturdays
+    from turnstile.pipeline import build_full, load_locations
+    from turnstile.stations import STATIONS_URL
+
+    stations_path = args.stations or STATIONS_URL
+    source = LocalDirectorySource(args.source_dir) if args.source_dir else None
+    if args.mode == 'full':
+        build_full(args.start_date, args.end_date, root=args.store, stations_path=stations_path, source=source)
+        return
+
+    saturday_list = all_saturdays(args.start_date, args.end_date)
+    locations = load_locations(stations_path)
+    if args.mode == 'incremental':
+        from turnstile.ingest import ingest_new_weeks
+        new_weeks = ingest_new_weeks(saturday_list, locations, root=args.store, source=source,
+                                     start_date=args.start_date)
+        print(f"Ingested {len(new_weeks)} new weeks.", file=sys.stderr)
+    elif args.mode == 'chunked':
+        from turnstile.chunked import build_chunked
+        build_chunked(saturday_list, locations, root=args.store, spill_dir=args.spill_dir, source=source,
+                      start_date=args.start_date)
+    else:
+        from turnstile.parallel import build_parallel
+        build_parallel(saturday_list, locations, max_workers=args.workers, root=args.store, source=source,
+                       start_date=args.start_date)
+
+def run_daily(args):
+    from turnstile.pipeline import build_daily
+
+    build_daily(args.store)
+
+def run_hourly(args):
+    from turnstile.pipeline import build_hourly
+
+    build_hourly(args.store)
+
+def run_rank_stations(args):
+    from turnstile.cube import TrafficCube
+    from turnstile.ranking import rank_stations
+
+    station_week = TrafficCube.load(args.store).station_week
+    if args.areas is None:
+        ranked = rank_stations(station_week, n=args.n)
+    else:
+        #rank within the polygons the stations' coordinates fall in rather than by the Borough column
+        from turnstile.pipeline import load_locations
+        from turnstile.spatial import station_areas
+        from turnstile.stations import STATIONS_URL
+
+        areas = station_areas(load_locations(args.stations or STATIONS_URL), args.areas, args.area_property)
+        ranked = rank_stations(station_week, n=args.n, by='area', areas=areas)
+    if args.borough is not None:
+        ranked = ranked[ranked.borough == args.borough]
+    ranked.to_csv(sys.stdout, index=False)
+
+def run_near(args):
+    from turnstile.pipeline import load_locations
+    from turnstile.spatial import StationIndex
+    from turnstile.stations import STATIONS_URL
+
+    points = [point.split(',') for point in args.points]
+    index = StationIndex(load_locations(args.stations or STATIONS_URL))
+    near = index.within([float(lat) for lat, _ in points], [float(lon) for _, lon in points], args.radius)
+    near[['query', 'station_id', 'stop_name', 'borough', 'gtfs_latitude', 'gtfs_longitude', 'distance_m']] \
+        .to_csv(sys.stdout, index=False)
+
+def run_peak_hours(args):
+    from turnstile.cube import TrafficCube
+    from turnstile.ranking import rank_stations, select_top_stations
+
+    cube = TrafficCube.load(args.store)
+    stations = args.stations or select_top_stations(rank_stations(cube.station_week, n=10))
+    if args.start or args.end:
+        #the cube has no time axis below the week, so date ranges are answered from the device store
+        from turnstile.devicestore import DeviceStore
+        grp_hourly_dow = DeviceStore.open(args.store).hourly_profile(stations, dows=args.days, width=args.width,
+                                                                     start=args.start, end=args.end)
+    else:
+        grp_hourly_dow = cube.hourly_profile(stations, dows=args.days, width=args.width)
+    grp_hourly_dow.to_csv(sys.stdout, index=False)
+
+    if args.plot:
+        from turnstile.plots import day_by_hour_figure, peak_days_by_hour_figure, render_figures
+        render_figures([peak_days_by_hour_figure(grp_hourly_dow), day_by_hour_figure(grp_hourly_dow)])
+
+def run_census(args):
+    from turnstile.census import census_densities, load_census
+
+    data = load_census(args.path, cache_dir=os.path.join(args.store, 'census'))
+    if args.densities:
+        census_densities(data).to_csv(sys.stdout)
+    else:
+        data.to_csv(sys.stdout)
+
+    if args.plot:
+        from turnstile.plots import census_figures, render_figures
+        render_figures(census_figures(data))
+
+def run_report(args):
+    from turnstile.cube import TrafficCube
+    from turnstile.plots import (census_figures, daily_traffic_figure, day_by_hour_figure, dow_traffic_figure,
+                                 peak_days_by_hour_figure, render_figures)
+    from turnstile.ranking import rank_stations, select_top_stations
+    from turnstile.stations import station_filter
+    from turnstile.store import read_table
+
+    cube = TrafficCube.load(args.store)
+    stations = select_top_stations(rank_stations(cube.station_week, n=10))
+    daily = read_table('daily', args.store, columns=['station_id', 'station', 'datetime', 'daily_entries'],
+                       filters=station_filter(stations, column='station_id'))
+    grp_hourly_dow = cube.hourly_profile(stations)
+
+    figures = [daily_traffic_figure(daily, stations, args.start, args.end),
+               dow_traffic_figure(cube.dow_profile(stations), stations),
+               peak_days_by_hour_figure(grp_hourly_dow),
+               day_by_hour_figure(grp_hourly_dow)]
+    if args.census:
+        from turnstile.census import load_census
+        figures += census_figures(load_census(args.census, cache_dir=os.path.join(args.store, 'census')))
+
+    for path in render_figures(figures, args.out_dir, max_workers=args.workers):
+        print(path)
+
+def run_compare_reports(args):
+    from turnstile.instrument import compare_reports
+
+    compare_reports(args.old, args.new).to_csv(sys.stdout, index=False)
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='turnstile', description="Stages of the MTA turnstile analysis.")
+    parser.add_argument('--store', default=STORE_DIR, help="directory of the columnar store (default: %(default)s)")
+    parser.add_argument('--report', default=None, help="write a JSON run report with per-stage timings to this path")
+    parser.add_argument('--trace-memory', action='store_true', help="record the peak traced memory of every stage in the report")
+    parser.add_argument('--profile', choices=['cprofile', 'pyinstrument'], default=None,
+                        help="profile the run and save the profile next to the report")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('ingest', help="fetch turnstile weeks and build the store from them")
+    command.add_argument('start_date', help="first date to ingest (X/X/XXXX)")
+    command.add_argument('end_date', help="last date to ingest (X/X/XXXX)")
+    command.add_argument('--mode', choices=['full', 'incremental', 'chunked', 'parallel'], default='full',
+                         help="rebuild everything in memory (default), add only new weeks, build one week at a "
+                              "time, or build with the per-week stages run in worker processes")
+    command.add_argument('--stations', default=None, help="path or URL of Stations.csv (default: the MTA's)")
+    command.add_argument('--source-dir', default=None, help="read the weekly files from this directory instead of the MTA's site")
+    command.add_argument('--workers', type=int, default=None, help="worker processes for --mode parallel (default: one per core)")
+    command.add_argument('--spill-dir', default=None, help="where --mode chunked spills intermediate deltas (default: inside the store)")
+    command.set_defaults(func=run_ingest)
+
+    command = commands.add_parser('daily', help="rebuild the daily dataset and cubes from the merged data in the store")
+    command.set_defaults(func=run_daily)
+
+    command = commands.add_parser('hourly', help="rebuild the hourly dataset and cube from the merged data in the store")
+    command.set_defaults(func=run_hourly)
+
+    command = commands.add_parser('rank-stations', help="top stations by mean weekly entries, per borough")
+    command.add_argument('-n', type=int, default=10, help="stations per borough (default: %(default)s)")
+    command.add_argument('--borough', default=None, help="only this borough (e.g. M, Bk, Q)")
+    command.add_argument('--areas', default=None, help="GeoJSON file of areas (e.g. census tracts) to rank stations within instead of boroughs")
+    command.add_argument('--area-property', default='name', help="feature property naming the areas (default: %(default)s)")
+    command.add_argument('--stations', default=None, help="path or URL of Stations.csv, for the station coordinates (default: the MTA's)")
+    command.set_defaults(func=run_rank_stations)
+
+    command = commands.add_parser('near', help="stations within a radius of points")
+    command.add_argument('points', nargs='+', help="points as LAT,LON")
+    command.add_argument('--radius', type=float, default=500, help="radius in metres (default: %(default)s)")
+    command.add_argument('--stations', default=None, help="path or URL of Stations.csv (default: the MTA's)")
+    command.set_defaults(func=run_near)
+
+    command = commands.add_parser('peak-hours', help="entries per block of hours and day of week for the top stations")
+    command.add_argument('--stations', nargs='+', type=int, default=None,
+                         help="station_ids to profile (default: the top stations of each borough)")
+    command.add_argument('--days', nargs='+', default=None, help="days of the week to profile (default: all)")
+    command.add_argument('--width', type=int, default=3, help="hours per block (default: %(default)s)")
+    command.add_argument('--start', default=None, help="only audits from this date (YYYY-MM-DD) on")
+    command.add_argument('--end', default=None, help="only audits before this date (YYYY-MM-DD)")
+    command.add_argument('--plot', action='store_true', help="also save the peak hour plots")
+    command.set_defaults(func=run_peak_hours)
+
+    command = commands.add_parser('census', help="cleaned census features per borough")
+    command.add_argument('--path', default='NYC Census Jan-09-2020.csv', help="census CSV (default: %(default)s)")
+    command.add_argument('--densities', action='store_true', help="print women and firms per square mile per borough code instead")
+    command.add_argument('--plot', action='store_true', help="also save the census plots")
+    command.set_defaults(func=run_census)
+
+    command = commands.add_parser('report', help="render every plot of the analysis, redrawing only the changed ones")
+    command.add_argument('--out-dir', default='.', help="directory the PNG files are saved to (default: %(default)s)")
+    command.add_argument('--start', default='2019-04-01', help="first day of the daily traffic plot (default: %(default)s)")
+    command.add_argument('--end', default='2019-04-29', help="last day of the daily traffic plot (default: %(default)s)")
+    command.add_argument('--census', default=None, help="census CSV to also plot (default: none)")
+    command.add_argument('--workers', type=int, default=None, help="worker processes drawing the plots (default: one per core)")
+    command.set_defaults(func=run_report)
+
+    command = commands.add_parser('compare-reports', help="compare the stages of two run reports")
+    command.add_argument('old', help="report of the earlier run")
+    command.add_argument('new', help="report of the later run")
+    command.set_defaults(func=run_compare_reports)
+
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.report is None:
+        if args.trace_memory or args.profile:
+            parser.error("--trace-memory and --profile need --report")
+        args.func(args)
+        return
+
+    from turnstile.instrument import RunReport
+
+    with RunReport(trace_memory=args.trace_memory, profile=args.profile) as report:
+        args.func(args)
+    report.save(args.report)
+
+if __name__ == '__main__':
+    main()
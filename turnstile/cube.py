@@ -0,0 +1,139 @@
+import os
+
+import pandas as pd
+
+from turnstile.hours import hour_blocks
+from turnstile.instrument import instrumented
+from turnstile.ranking import mean_weekly_entries, rank_stations
+from turnstile.stations import station_subset
+from turnstile.store import STORE_DIR, week_start
+
+"""
+Pre-aggregated traffic cubes and the queries the analysis scripts ask of them.
+
+station_week       entries per station and week
+station_dow        sum and count of daily entries per station and day of week
+station_dow_hour   sum and count of hourly entries per station, day of week and audit hour
+
+Sums and counts are kept rather than means, so cubes built from separate chunks or weeks
+can be combined by adding them up, and the queries take their means from the totals.
+"""
+
+CUBE_DIR = 'cubes'
+
+CUBE_KEYS = {'station_week': ['station_id', 'station', 'borough', 'week'],
+             'station_dow': ['station_id', 'station', 'borough', 'dow', 'dow_num'],
+             'station_dow_hour': ['station_id', 'station', 'borough', 'dow', 'hour']}
+
+def cube_parts(daily=None, hourly=None):
+    """Aggregates a daily and/or hourly dataset (or one chunk of them) into cube parts."""
+
+    parts = {}
+    if daily is not None:
+        week = daily.week if 'week' in daily.columns else week_start(daily.datetime)
+        daily = daily.assign(week=week)
+        parts['station_week'] = daily.groupby(CUBE_KEYS['station_week'], observed=True)['daily_entries'] \
+                                     .agg(weekly_entries='sum').reset_index()
+        parts['station_dow'] = daily.groupby(CUBE_KEYS['station_dow'], observed=True)['daily_entries'] \
+                                    .agg(entries='sum', days='count').reset_index()
+    if hourly is not None:
+        hourly = hourly.assign(hour=hourly.datetime.dt.hour)
+        parts['station_dow_hour'] = hourly.groupby(CUBE_KEYS['station_dow_hour'], observed=True)['hourly_entries'] \
+                                          .agg(entries='sum', readings='count').reset_index()
+    return parts
+
+class TrafficCube:
+    """Station traffic cubes with top-N and profile queries."""
+
+    def __init__(self, station_week, station_dow, station_dow_hour):
+        self.station_week = station_week
+        self.station_dow = station_dow
+        self.station_dow_hour = station_dow_hour
+
+    @classmethod
+    def from_parts(cls, parts):
+        """Combines cube parts (dicts returned by cube_parts, or cubes' tables) by adding them up."""
+
+        tables = {}
+        for name, keys in CUBE_KEYS.items():
+            frames = [part[name] for part in parts if part.get(name) is not None]
+            if not frames:
+                tables[name] = None
+                continue
+            combined = pd.concat([frame.astype({key: str for key in keys if key not in ('station_id', 'dow_num', 'hour')})
+                                  for frame in frames], ignore_index=True)
+            tables[name] = combined.groupby(keys, observed=True).sum(numeric_only=True).reset_index()
+        return cls(**tables)
+
+    @classmethod
+    @instrumented
+    def build(cls, daily, hourly):
+        return cls.from_parts([cube_parts(daily, hourly)])
+
+    def tables(self):
+        return {'station_week': self.station_week, 'station_dow': self.station_dow,
+                'station_dow_hour': self.station_dow_hour}
+
+    def merge(self, other):
+        return TrafficCube.from_parts([self.tables(), other.tables()])
+
+    def replace(self, other):
+        """Returns a cube with the tables other has in place of this cube's (e.g. after rebuilding one dataset)."""
+
+        tables = self.tables()
+        tables.update({name: table for name, table in other.tables().items() if table is not None})
+        return TrafficCube(**tables)
+
+    @instrumented
+    def save(self, root=STORE_DIR):
+        os.makedirs(os.path.join(root, CUBE_DIR), exist_ok=True)
+        for name, table in self.tables().items():
+            if table is not None:
+                table.to_parquet(os.path.join(root, CUBE_DIR, f"{name}.parquet"), index=False)
+
+    @classmethod
+    @instrumented
+    def load(cls, root=STORE_DIR):
+        tables = {}
+        for name in CUBE_KEYS:
+            path = os.path.join(root, CUBE_DIR, f"{name}.parquet")
+            tables[name] = pd.read_parquet(path) if os.path.exists(path) else None
+        return cls(**tables)
+
+    def mean_weekly_entries(self):
+        """Mean weekly entries per station."""
+
+        return mean_weekly_entries(self.station_week)
+
+    def top_stations(self, borough=None, n=10):
+        """Returns the n stations with the most mean weekly entries, optionally within one borough."""
+
+        if borough is None:
+            return rank_stations(self.station_week, n=n, by=None)
+        ranked = rank_stations(self.station_week, n=n)
+        return ranked[ranked.borough == borough].reset_index(drop=True)
+
+    @instrumented
+    def dow_profile(self, stations=None):
+        """Mean daily entries per station and day of week, for all stations or a subset of station_ids."""
+
+        data = self.station_dow if stations is None else station_subset(self.station_dow, stations, column='station_id')
+        profile = data.groupby(['station_id', 'station', 'dow', 'dow_num'], observed=True)[['entries', 'days']].sum().reset_index()
+        profile['mean_dow_entries'] = profile.entries / profile.days
+        return profile.drop(columns=['entries', 'days'])
+
+    @instrumented
+    def hourly_profile(self, stations=None, dows=None, width=3):
+        """
+        Entries per block of hours and day of week for a set of station_ids: the mean hourly entries of each
+        audit hour over the stations, summed over the hours of each block (as entries_per_hour_block).
+        """
+
+        data = self.station_dow_hour if stations is None else station_subset(self.station_dow_hour, stations, column='station_id')
+        if dows is not None:
+            data = data[data.dow.isin(list(dows))]
+        hourly = data.groupby(['dow', 'hour'], observed=True)[['entries', 'readings']].sum().reset_index()
+        hourly['hourly_mean'] = hourly.entries / hourly.readings
+        hourly['hour_group'] = hour_blocks(hourly.hour, width=width)
+        return hourly.groupby(['dow', 'hour_group'], observed=True)['hourly_mean'] \
+                     .agg(entries_per_hour_group='sum').reset_index()
@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+
+from turnstile.instrument import instrumented
+
+"""
+Per-turnstile counter deltas for the daily and hourly datasets.
+
+The readings are sorted once by turnstile (c_a, unit, scp) and time. After that every
+turnstile, day and audit time is a contiguous run of rows, so the readings per run and the
+differences between consecutive runs are computed with NumPy on the sorted arrays. Both the
+daily and the hourly dataset come out of the same sort.
+
+The ENTRIES register is a cumulative counter. When it goes down, it either wrapped
+around (the previous reading was close to COUNTER_MODULUS and the new one is close to zero)
+or it was reset. Wrap-arounds are counted through the wrap; resets leave no delta (NaN).
+"""
+
+DEVICE_COLS = ['c_a', 'unit', 'scp']
+COUNTER_MODULUS = 2**32
+MAX_ROLLOVER_DELTA = 100_000
+NANOSECONDS_PER_DAY = 86_400 * 10**9
+
+def counter_deltas(previous, current, counter_modulus=COUNTER_MODULUS, max_rollover_delta=MAX_ROLLOVER_DELTA):
+    """
+    Returns current - previous for cumulative counters, counting through wrap-arounds
+    and returning NaN where the counter went down because it was reset.
+    """
+
+    deltas = (current - previous).astype(float)
+    wrapped = current + counter_modulus - previous
+    rollover = (deltas < 0) & (wrapped >= 0) & (wrapped <= max_rollover_delta)
+    deltas[rollover] = wrapped[rollover]
+    deltas[deltas < 0] = np.nan
+    return deltas
+
+def _runs(device, key):
+    """Returns the start positions of the runs of equal (device, key) in sorted arrays."""
+
+    change = np.empty(len(device), dtype=bool)
+    change[:1] = True
+    change[1:] = (device[1:] != device[:-1]) | (key[1:] != key[:-1])
+    return np.flatnonzero(change)
+
+def _run_deltas(device, starts, entries):
+    """
+    Takes the minimum reading of each run and returns it together with the delta from each run
+    to the next run of the same turnstile (NaN for the last run of a turnstile).
+    """
+
+    readings = np.minimum.reduceat(entries, starts)
+    deltas = np.full(len(starts), np.nan)
+    same_device = device[starts[1:]] == device[starts[:-1]]
+    deltas[:-1] = np.where(same_device, counter_deltas(readings[:-1], readings[1:]), np.nan)
+    return readings, deltas
+
+def _gather(data, columns, positions):
+    return {col: data[col].take(positions).array for col in columns}
+
+@instrumented
+def daily_and_hourly_deltas(data):
+    """
+    Computes daily and hourly entries for every turnstile from a single sort.
+
+    daily_entries for a day is the lowest reading of the next day minus the lowest reading of
+    that day. hourly_entries for an audit is its reading minus the previous audit's reading of
+    the same turnstile. Rows without a delta (last day, first audit, counter resets) are dropped.
+    """
+
+    device = data.groupby(DEVICE_COLS, observed=True, sort=False).ngroup().to_numpy()
+    timestamps = data.datetime.to_numpy().astype('datetime64[ns]').astype(np.int64)
+    order = np.lexsort((timestamps, device))
+
+    device = device[order]
+    timestamps = timestamps[order]
+    entries = data.entries.to_numpy().astype(np.int64)[order]
+    attributes = [col for col in DEVICE_COLS + ['station', 'station_id', 'borough'] if col in data.columns]
+
+    # daily: one run per turnstile and day, delta to the next day attributed to the earlier day
+    day_starts = _runs(device, timestamps // NANOSECONDS_PER_DAY)
+    day_readings, daily_entries = _run_deltas(device, day_starts, entries)
+    daily = pd.DataFrame(_gather(data, attributes, order[day_starts]))
+    daily['datetime'] = pd.to_datetime(timestamps[day_starts] // NANOSECONDS_PER_DAY * NANOSECONDS_PER_DAY)
+    daily['entries'] = day_readings
+    daily['daily_entries'] = daily_entries
+
+    # hourly: one run per turnstile and audit time, delta from the previous audit
+    audit_starts = _runs(device, timestamps)
+    audit_readings, next_deltas = _run_deltas(device, audit_starts, entries)
+    hourly = pd.DataFrame(_gather(data, attributes, order[audit_starts]))
+    hourly['datetime'] = pd.to_datetime(timestamps[audit_starts])
+    hourly['entries'] = audit_readings
+    hourly['hourly_entries'] = np.concatenate([[np.nan], next_deltas[:-1]])
+
+    return daily[daily.daily_entries.notna()], hourly[hourly.hourly_entries.notna()]
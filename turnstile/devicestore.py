@@ -0,0 +1,283 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+from numpy.lib.format import open_memmap
+
+from turnstile.hours import hour_blocks
+from turnstile.instrument import instrumented
+from turnstile.store import STORE_DIR, list_partitions, read_table, week_start
+
+"""
+Memory-mapped store of the hourly entries of every turnstile, for queries about a few stations.
+
+The hourly dataset is kept in segments, each covering the rows added at one time: a full build
+writes a single segment, and every week an incremental run ingests is appended as a new segment,
+so the weekly job only writes its own rows. Each segment is laid out as flat arrays sorted by
+turnstile and time:
+
+timestamps.npy       int64 audit times, in seconds since 1970-01-01 (local time, as in the data)
+deltas.npy           int32 hourly entries
+device_offsets.npy   the rows of turnstile i are device_offsets[i]:device_offsets[i + 1]
+
+index.json lists the segments with their first and last audits, and the turnstile (station_id, c_a,
+unit, scp) and station (station_id, station, borough) behind each turnstile number. Turnstiles first
+seen in an appended segment are numbered after the existing ones, and have no rows in the segments
+before it. Queries skip the segments outside their time range; a long run of appended segments is
+merged back into one by the next full build (any --mode but incremental).
+
+The arrays are opened with np.load(mmap_mode='r'), so a query only reads the pages of the
+stations (and, with start/end, the time range) it asks for, and processes running queries at
+the same time share the pages through the OS page cache.
+"""
+
+DEVICE_STORE_DIR = 'devices'
+INDEX_FILE = 'index.json'
+DEVICE_KEYS = ['station_id', 'c_a', 'unit', 'scp']
+STATION_KEYS = ['station_id', 'station', 'borough']
+DAY_NAMES = np.array(['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'])
+SECONDS_PER_DAY = 86_400
+
+def _device_keys(data):
+    """The turnstile key columns (and, with station and borough, its station's) in the types kept in the index."""
+
+    keys = data[[col for col in DEVICE_KEYS + ['station', 'borough'] if col in data.columns]].astype(str)
+    return keys.assign(station_id=data.station_id.astype(np.int64))
+
+def _device_index(data):
+    return pd.MultiIndex.from_frame(_device_keys(data)[DEVICE_KEYS])
+
+def _seconds(datetimes):
+    return np.asarray(datetimes, dtype='datetime64[s]').astype(np.int64)
+
+def _segment_name(number):
+    return f"segment_{number:05d}"
+
+def _write_segment(path, device_index, device_offsets, chunks):
+    """
+    Writes a segment from chunks of (label, hourly rows) that are disjoint in time and come in time order,
+    given the turnstile numbers (device_index) and the offsets of their rows. Returns the segment's entry
+    for the index.
+    """
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    rows = int(device_offsets[-1])
+    timestamps = open_memmap(os.path.join(path, 'timestamps.npy'), mode='w+', dtype=np.int64, shape=(rows,))
+    deltas = open_memmap(os.path.join(path, 'deltas.npy'), mode='w+', dtype=np.int32, shape=(rows,))
+
+    # chunks are read in time order, so each turnstile's rows are filled in time order
+    filled = np.zeros(len(device_offsets) - 1, dtype=np.int64)
+    for label, data in chunks:
+        device = device_index.get_indexer(_device_index(data))
+        seconds = _seconds(data.datetime)
+        order = np.lexsort((seconds, device))
+        device = device[order]
+        values = data.hourly_entries.to_numpy()[order]
+        if len(values) and values.max() >= 2**31:
+            raise ValueError(f"Hourly entries of {label} do not fit in int32.")
+
+        rank = np.arange(len(device)) - np.searchsorted(device, device)
+        positions = device_offsets[device] + filled[device] + rank
+        timestamps[positions] = seconds[order]
+        deltas[positions] = values
+        filled += np.bincount(device, minlength=len(filled))
+
+    timestamps.flush()
+    deltas.flush()
+    first, last = (int(timestamps.min()), int(timestamps.max())) if rows else (None, None)
+    del timestamps, deltas
+    np.save(os.path.join(path, 'device_offsets.npy'), device_offsets)
+    return {'name': os.path.basename(path), 'first': first, 'last': last}
+
+def _save_index(directory, weeks, devices, stations, segments):
+    tmp_path = os.path.join(directory, INDEX_FILE + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump({'weeks': weeks,
+                   'devices': devices[DEVICE_KEYS].to_dict(orient='list'),
+                   'stations': stations[STATION_KEYS].to_dict(orient='list'),
+                   'segments': segments}, f)
+    os.replace(tmp_path, os.path.join(directory, INDEX_FILE))
+
+@instrumented
+def build_device_store(root=STORE_DIR):
+    """
+    Writes the device store from the hourly dataset in the store as a single segment, one week
+    partition at a time, so that only a week of the hourly dataset is in memory at once.
+    """
+
+    weeks = list_partitions('hourly', root)
+
+    # pass 1: readings per turnstile, to lay out the arrays
+    counts = []
+    for week in weeks:
+        data = read_table('hourly', root, columns=DEVICE_KEYS + ['station', 'borough'], filters=[('week', '=', week)])
+        counts.append(_device_keys(data).value_counts().rename('rows').reset_index())
+    devices = pd.concat(counts).groupby(DEVICE_KEYS).agg({'rows': 'sum', 'station': 'first', 'borough': 'first'})
+    devices = devices.sort_index().reset_index()
+
+    device_offsets = np.concatenate([[0], np.cumsum(devices.rows.to_numpy())])
+    stations = devices.drop_duplicates('station_id')[STATION_KEYS].reset_index(drop=True)
+
+    tmp_dir = os.path.join(root, DEVICE_STORE_DIR + '.tmp')
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    # pass 2: weeks are disjoint in time and read in order
+    chunks = ((f"week {week}", read_table('hourly', root, columns=DEVICE_KEYS + ['datetime', 'hourly_entries'],
+                                          filters=[('week', '=', week)])) for week in weeks)
+    segment = _write_segment(os.path.join(tmp_dir, _segment_name(0)), _device_index(devices), device_offsets, chunks)
+    _save_index(tmp_dir, weeks, devices, stations, [segment])
+
+    # swap the new store in; processes that have the old one open keep reading the old files
+    path = os.path.join(root, DEVICE_STORE_DIR)
+    old_dir = path + '.old'
+    if os.path.exists(path):
+        os.replace(path, old_dir)
+    os.replace(tmp_dir, path)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+def has_device_store(root=STORE_DIR):
+    """Whether the store has a device store that segments can be appended to."""
+
+    try:
+        with open(os.path.join(root, DEVICE_STORE_DIR, INDEX_FILE)) as f:
+            return 'segments' in json.load(f)
+    except FileNotFoundError:
+        return False
+
+@instrumented
+def append_device_segment(hourly, root=STORE_DIR):
+    """
+    Adds the hourly rows, which must all come after the rows of their turnstiles already in the
+    device store, as a new segment. Only the new rows are written, and the index is replaced in
+    one step once the segment is complete, so queries see either all or none of it.
+    """
+
+    directory = os.path.join(root, DEVICE_STORE_DIR)
+    with open(os.path.join(directory, INDEX_FILE)) as f:
+        index = json.load(f)
+    devices = pd.DataFrame(index['devices'])
+    stations = pd.DataFrame(index['stations'])
+
+    # turnstiles and stations not seen before are numbered after the existing ones
+    keys = _device_keys(hourly).drop_duplicates(DEVICE_KEYS)
+    new_devices = keys[~_device_index(keys).isin(_device_index(devices))].sort_values(DEVICE_KEYS)
+    devices = pd.concat([devices, new_devices[DEVICE_KEYS]], ignore_index=True)
+    new_stations = new_devices[~new_devices.station_id.isin(stations.station_id)].drop_duplicates('station_id')
+    stations = pd.concat([stations, new_stations[STATION_KEYS]], ignore_index=True)
+
+    device_index = _device_index(devices)
+    counts = np.bincount(device_index.get_indexer(_device_index(hourly)), minlength=len(devices))
+    device_offsets = np.concatenate([[0], np.cumsum(counts)])
+    segment = _write_segment(os.path.join(directory, _segment_name(len(index['segments']))), device_index,
+                             device_offsets, [('the appended rows', hourly)])
+
+    weeks = sorted(set(index['weeks']) | set(week_start(hourly.datetime)))
+    _save_index(directory, weeks, devices, stations, index['segments'] + [segment])
+
+class DeviceSegment:
+    """One segment of a device store, with offsets for every turnstile of the store's index."""
+
+    def __init__(self, directory, n_devices):
+        self.timestamps = np.load(os.path.join(directory, 'timestamps.npy'), mmap_mode='r')
+        self.deltas = np.load(os.path.join(directory, 'deltas.npy'), mmap_mode='r')
+        offsets = np.load(os.path.join(directory, 'device_offsets.npy'))
+        # turnstiles numbered after the segment was written have no rows in it
+        self.device_offsets = np.append(offsets, np.full(n_devices + 1 - len(offsets), offsets[-1]))
+
+    def row_ranges(self, devices, start=None, end=None):
+        """
+        Returns the (first, last + 1) rows of each turnstile in devices, limited to audits in [start, end)
+        (in seconds) by a binary search within each turnstile's rows.
+        """
+
+        lows = self.device_offsets[devices]
+        highs = self.device_offsets[devices + 1]
+        if start is not None or end is not None:
+            bounds = [self.timestamps[low:high] for low, high in zip(lows, highs)]
+            if start is not None:
+                lows = lows + np.array([np.searchsorted(times, start) for times in bounds], dtype=np.int64)
+            if end is not None:
+                highs = self.device_offsets[devices] + np.array([np.searchsorted(times, end) for times in bounds], dtype=np.int64)
+        return lows, highs
+
+class DeviceStore:
+    """Read-only view of a device store (see build_device_store) with station and time range queries."""
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, INDEX_FILE)) as f:
+            index = json.load(f)
+        self.weeks = index['weeks']
+        self.devices = pd.DataFrame(index['devices'])
+        self.stations = pd.DataFrame(index['stations'])
+        self.segments = [DeviceSegment(os.path.join(directory, segment['name']), len(self.devices))
+                         for segment in index['segments']]
+        self.segment_times = [(segment['first'], segment['last']) for segment in index['segments']]
+
+    @classmethod
+    def open(cls, root=STORE_DIR):
+        return cls(os.path.join(root, DEVICE_STORE_DIR))
+
+    def device_numbers(self, stations=None):
+        """Returns the numbers of the turnstiles of the stations with the given station_ids (all turnstiles when stations is None)."""
+
+        if stations is None:
+            return np.arange(len(self.devices))
+        return np.flatnonzero(self.devices.station_id.isin(list(stations)).to_numpy())
+
+    def _gather(self, stations, start, end):
+        devices = self.device_numbers(stations)
+        start = None if start is None else _seconds(pd.Timestamp(start).to_datetime64())
+        end = None if end is None else _seconds(pd.Timestamp(end).to_datetime64())
+
+        parts = [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32))]
+        for segment, (first, last) in zip(self.segments, self.segment_times):
+            if first is None or (start is not None and last < start) or (end is not None and first >= end):
+                continue
+            lows, highs = segment.row_ranges(devices, start, end)
+            parts.append((devices.repeat(highs - lows),
+                          np.concatenate([segment.timestamps[low:high] for low, high in zip(lows, highs)] + [parts[0][1]]),
+                          np.concatenate([segment.deltas[low:high] for low, high in zip(lows, highs)] + [parts[0][2]])))
+        devices, timestamps, deltas = (np.concatenate(columns) for columns in zip(*parts))
+        if len(parts) <= 2:
+            return devices, timestamps, deltas
+
+        # segments are in time order, so a stable sort by turnstile keeps each turnstile's rows in time order
+        order = np.argsort(devices, kind='stable')
+        return devices[order], timestamps[order], deltas[order]
+
+    @instrumented
+    def read(self, stations=None, start=None, end=None):
+        """Returns the hourly entries of the given station_ids (audits in [start, end) if given) as a DataFrame."""
+
+        devices, timestamps, deltas = self._gather(stations, start, end)
+        data = self.devices.take(devices).reset_index(drop=True)
+        data = data.merge(self.stations, on='station_id', how='left', sort=False)
+        data['datetime'] = timestamps.astype('datetime64[s]')
+        data['dow'] = DAY_NAMES[(timestamps // SECONDS_PER_DAY + 3) % 7]
+        data['hourly_entries'] = deltas
+        return data
+
+    @instrumented
+    def hourly_profile(self, stations=None, dows=None, width=3, start=None, end=None):
+        """
+        Entries per block of hours and day of week for a set of stations (as TrafficCube.hourly_profile),
+        optionally only over the audits in [start, end).
+        """
+
+        _, timestamps, deltas = self._gather(stations, start, end)
+        # 1970-01-01 was a Thursday
+        keys = (timestamps // SECONDS_PER_DAY + 3) % 7 * 24 + timestamps % SECONDS_PER_DAY // 3600
+        hours = np.arange(7 * 24)
+        hourly = pd.DataFrame({'dow': DAY_NAMES[hours // 24], 'hour': hours % 24,
+                               'entries': np.bincount(keys, weights=deltas, minlength=len(hours)),
+                               'readings': np.bincount(keys, minlength=len(hours))})
+        hourly = hourly[hourly.readings > 0]
+        if dows is not None:
+            hourly = hourly[hourly.dow.isin(list(dows))]
+        hourly['hourly_mean'] = hourly.entries / hourly.readings
+        hourly['hour_group'] = hour_blocks(hourly.hour, width=width)
+        return hourly.groupby(['dow', 'hour_group'])['hourly_mean'].agg(entries_per_hour_group='sum').reset_index()
@@ -0,0 +1,56 @@
+from turnstile.deltas import daily_and_hourly_deltas
+from turnstile.instrument import instrumented
+
+"""
+Feature engineering on the merged turnstile/location data: daily and hourly entry datasets.
+
+Outliers caused by system reboots are cut at a quantile of the entries. By default this is the
+exact quantile of the data passed in; an OutlierFilter (see turnstile.outliers) can be passed
+instead to cut at a quantile estimated over every chunk it has seen. With update=False the
+filter is only applied, e.g. once it has already seen the whole dataset.
+"""
+
+DAILY_QUANTILE = .997
+HOURLY_QUANTILE = .99
+
+@instrumented
+def prepare_datasets(data, daily_outliers=None, hourly_outliers=None):
+    """Builds the daily and hourly datasets from one pass over the readings."""
+
+    daily, hourly = daily_and_hourly_deltas(data)
+    return finish_daily_dataset(daily, daily_outliers), finish_hourly_dataset(hourly, hourly_outliers)
+
+@instrumented
+def finish_daily_dataset(daily, outliers=None, update=True):
+
+    #remove outliers caused by system reboot that happens randomly (counter resets are already dropped)
+    if outliers is None:
+        daily = daily[daily.daily_entries < daily.daily_entries.quantile(q =DAILY_QUANTILE)].copy()
+    else:
+        daily = (outliers.update_and_apply(daily) if update else outliers.apply(daily)).copy()
+
+    #create columns that indicate day of week and number of day of the week
+    daily['dow'] = daily.datetime.dt.day_name()
+    daily['dow_num'] = daily.datetime.dt.dayofweek
+
+    return daily
+
+@instrumented
+def finish_hourly_dataset(hourly, outliers=None, update=True):
+
+    #remove outliers caused by system reboot that happens randomly (counter resets are already dropped)
+    if outliers is None:
+        hourly = hourly[hourly.hourly_entries < hourly.hourly_entries.quantile(q =HOURLY_QUANTILE)].copy()
+    else:
+        hourly = (outliers.update_and_apply(hourly) if update else outliers.apply(hourly)).copy()
+
+    #create columns that indicate day of week
+    hourly['dow'] = hourly.datetime.dt.day_name()
+
+    return hourly
+
+def prepare_daily_dataset(data):
+    return prepare_datasets(data)[0]
+
+def prepare_hourly_dataset(data):
+    return prepare_datasets(data)[1]
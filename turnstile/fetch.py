@@ -0,0 +1,134 @@
+import datetime
+import hashlib
+import os
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from turnstile.instrument import instrumented
+
+"""
+Fetch layer for the weekly MTA turnstile files.
+
+Weekly files are downloaded concurrently with a bounded thread pool and kept in a
+content-addressed cache on disk, so a re-run only downloads weeks it does not have yet.
+Where the files come from is pluggable: the MTA website by default, or a local
+directory / local HTTP server for testing. Weeks are cached per source (by its URL), and
+files in a local directory are read where they are rather than copied into the cache.
+"""
+
+MTA_TURNSTILE_URL = "http://web.mta.info/developers/data/nyct/turnstile/turnstile_{}.txt"
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "mta_turnstile")
+
+def all_saturdays(start_date, end_date):
+    """ Takes two dates and returns a list of saturdays between the first date and a week after the second date"""
+
+    modified_end_date = datetime.datetime.strptime(end_date,'%m/%d/%Y') + datetime.timedelta(weeks = 1)
+    saturday_list = pd.date_range(start=start_date, end=modified_end_date,
+                              freq='W-SAT').strftime('%m/%d/%Y').tolist()
+    return saturday_list
+
+def week_key(date):
+    """Converts a MM/DD/YYYY date into the YYMMDD key used in the turnstile file names."""
+
+    return date[-2:]+date[:2]+date[3:5]
+
+class HttpSource:
+    """Serves weekly files over HTTP. Point base_url at a local server to stand in for the MTA site."""
+
+    def __init__(self, base_url=MTA_TURNSTILE_URL, timeout=60):
+        self.base_url = base_url
+        self.timeout = timeout
+        #the weeks of different servers are kept apart in the cache
+        self.namespace = hashlib.sha256(base_url.encode()).hexdigest()[:16]
+
+    def fetch(self, week):
+        with urllib.request.urlopen(self.base_url.format(week), timeout=self.timeout) as response:
+            return response.read()
+
+class LocalDirectorySource:
+    """Serves weekly files named turnstile_YYMMDD.txt from a local directory."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, week):
+        return os.path.join(self.directory, f"turnstile_{week}.txt")
+
+    def fetch(self, week):
+        with open(self.path(week), 'rb') as f:
+            return f.read()
+
+class WeekCache:
+    """
+    Content-addressed on-disk cache of weekly files.
+    File contents are stored once under objects/ by their sha256, and weeks/<namespace>/<YYMMDD>
+    records which object holds a given week of the source with that namespace.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR):
+        self.directory = directory
+        os.makedirs(os.path.join(directory, 'objects'), exist_ok=True)
+        os.makedirs(os.path.join(directory, 'weeks'), exist_ok=True)
+
+    def _week_ref(self, week, namespace):
+        return os.path.join(self.directory, 'weeks', namespace, week)
+
+    def _object_path(self, digest):
+        return os.path.join(self.directory, 'objects', digest)
+
+    def path(self, week, namespace):
+        """Returns the cached file path for a week of a source, or None if the week has not been fetched."""
+
+        try:
+            with open(self._week_ref(week, namespace)) as f:
+                digest = f.read().strip()
+        except FileNotFoundError:
+            return None
+        object_path = self._object_path(digest)
+        return object_path if os.path.exists(object_path) else None
+
+    def store(self, week, namespace, content):
+        """Stores the content of a week of a source and returns the path of the cached file."""
+
+        digest = hashlib.sha256(content).hexdigest()
+        object_path = self._object_path(digest)
+        if not os.path.exists(object_path):
+            _atomic_write(object_path, content)
+        os.makedirs(os.path.dirname(self._week_ref(week, namespace)), exist_ok=True)
+        _atomic_write(self._week_ref(week, namespace), digest.encode())
+        return object_path
+
+def _atomic_write(path, content):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+@instrumented
+def fetch_weeks(saturday_list, source=None, cache=None, max_workers=8):
+    """
+    Makes sure every week in saturday_list is in the cache, downloading the missing weeks
+    concurrently. Returns a dict of {saturday: cached file path} in the order given.
+    Weeks of a local directory are not cached; their paths in the directory are returned.
+    """
+
+    source = source if source is not None else HttpSource()
+    if isinstance(source, LocalDirectorySource):
+        return {saturday: source.path(week_key(saturday)) for saturday in saturday_list}
+    cache = cache if cache is not None else WeekCache()
+
+    paths = {saturday: cache.path(week_key(saturday), source.namespace) for saturday in saturday_list}
+    missing = [saturday for saturday, path in paths.items() if path is None]
+
+    def download(saturday):
+        week = week_key(saturday)
+        return cache.store(week, source.namespace, source.fetch(week))
+
+    if missing:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for saturday, path in zip(missing, pool.map(download, missing)):
+                paths[saturday] = path
+
+    return paths
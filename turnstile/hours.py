@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+
+"""
+Bucketing of audit hours into blocks of the day.
+
+Audits are normally taken every 4 hours at 0, 4, 8, ... but during daylight saving time
+part of the data is recorded at 3, 7, 11, ... instead. Blocks are right-closed, so with the
+default 3 hour blocks hour 0 is its own block and hours 1-3 fall in block 3, 4-6 in block 6, etc.
+"""
+
+def hour_blocks(hours, width=3, offset=0, dst_align=None):
+    """
+    Returns the block each hour falls in, labelled by the block's closing hour.
+    width is the block length in hours and offset shifts the block edges (0 <= offset < width).
+    dst_align=4 first moves readings taken an hour early by daylight saving time
+    (3, 7, 11, ... 23) onto the standard 4 hour schedule (4, 8, 12, ... 24).
+    hours must be numbers from 0 to 24 (or NaN); timestamps and other values raise rather than being bucketed.
+    """
+
+    values = np.asarray(hours)
+    if not np.issubdtype(values.dtype, np.number):
+        raise TypeError(f"hour_blocks takes hours of the day as numbers, not {values.dtype} (use .dt.hour on timestamps).")
+    values = values.astype(float)
+    if ((values < 0) | (values > 24)).any():
+        raise ValueError("hour_blocks takes hours of the day from 0 to 24.")
+    if dst_align:
+        values = np.where(values % dst_align == dst_align - 1, values + 1, values)
+
+    edges = np.arange(offset - width, 24 + 2 * width, width, dtype=float)
+    # only NaN digitizes past the last edge; it is put back as NaN below
+    blocks = edges[np.digitize(values, edges, right=True).clip(0, len(edges) - 1)]
+    blocks = np.where(np.isnan(values), np.nan, blocks)
+
+    if isinstance(hours, pd.Series):
+        return pd.Series(blocks, index=hours.index, name='hour_group')
+    return blocks
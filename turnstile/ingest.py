@@ -0,0 +1,249 @@
+import json
+import os
+
+import pandas as pd
+
+from turnstile.cleaning import DuplicateFilter, reading_keys, remove_duplicates
+from turnstile.cube import TrafficCube
+from turnstile.deltas import daily_and_hourly_deltas
+from turnstile.devicestore import append_device_segment, build_device_store, has_device_store
+from turnstile.features import DAILY_QUANTILE, HOURLY_QUANTILE, finish_daily_dataset, finish_hourly_dataset
+from turnstile.fetch import week_key
+from turnstile.instrument import instrumented
+from turnstile.load import DUPLICATE_WINDOW, stream_weeks
+from turnstile.outliers import OutlierFilter, compare_to_exact
+from turnstile.schema import concat_weeks
+from turnstile.stations import attach_stations, build_station_dimension, normalize_mta_station_names
+from turnstile.store import STORE_DIR, list_partitions, write_table
+
+"""
+Incremental ingest of newly published turnstile weeks.
+
+A manifest in the store records which weeks have been ingested and the date the store starts
+from. Only weeks newer than every week ingested can be appended, and not from an earlier start
+date; filling in older weeks needs a full rebuild. Alongside the manifest, the store
+keeps the readings from the last day of every turnstile ("tail"). The last day's daily entries
+and the first reading's hourly entries of the next week can only be computed once that week
+arrives, so a new week is processed together with the tail and only the new rows are appended.
+
+The traffic cubes are updated with the new rows as well, and each new week's hourly rows are
+appended to the device store as a segment. The device store is only built from the whole hourly
+dataset when the store has none yet.
+Outliers are cut with quantiles estimated over everything ingested so far. The quantile
+sketches behind them are kept in the store too, so each run only adds the new week to them.
+How each week's cut differs from the exact quantile of that week alone is saved in an outlier report.
+"""
+
+MANIFEST_FILE = 'manifest.json'
+TAIL_FILE = 'tail.parquet'
+OUTLIERS_FILE = 'outliers.json'
+OUTLIER_REPORT_FILE = 'outlier_report.json'
+DEVICE_COLS = ['c_a', 'unit', 'scp', 'station']
+
+def load_manifest(root=STORE_DIR):
+    """
+    Returns the set of YYMMDD week keys already ingested into the store and the start date (X/X/XXXX)
+    readings were kept from, None if the weeks were ingested whole.
+    """
+
+    try:
+        with open(os.path.join(root, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return set(), None
+    return set(manifest['weeks']), manifest.get('start_date')
+
+def save_manifest(weeks, start_date=None, root=STORE_DIR):
+    os.makedirs(root, exist_ok=True)
+    tmp_path = os.path.join(root, MANIFEST_FILE + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump({'weeks': sorted(weeks), 'start_date': start_date}, f, indent=1)
+    os.replace(tmp_path, os.path.join(root, MANIFEST_FILE))
+
+def first_reading_day(start_date, week_keys):
+    """The first day a store keeps readings from: start_date, or the week before its first Saturday (its first file)."""
+
+    if start_date is not None:
+        return pd.to_datetime(start_date, format="%m/%d/%Y")
+    return pd.to_datetime(min(week_keys), format="%y%m%d") - pd.Timedelta(weeks=1)
+
+def check_appendable(saturday_list, start_date, ingested, ingested_start):
+    """
+    Raises a ValueError when the weeks of saturday_list missing from the manifest cannot be appended:
+    the store would need readings from before its start date, or a missing week is older than the
+    newest week ingested (its deltas depend on the weeks after it, which are already in the store).
+    """
+
+    if not ingested:
+        return
+    store_start = first_reading_day(ingested_start, ingested)
+    if first_reading_day(start_date, [week_key(saturday) for saturday in saturday_list]) < store_start:
+        raise ValueError(f"The store keeps readings from {store_start:%m/%d/%Y} on; ingesting from an earlier "
+                         "start date needs a full rebuild (--mode full).")
+    older = [saturday for saturday in saturday_list if week_key(saturday) not in ingested and week_key(saturday) < max(ingested)]
+    if older:
+        raise ValueError(f"Weeks {', '.join(older)} are older than the newest week ingested ({max(ingested)}) and can "
+                         "only be added with a full rebuild (--mode full).")
+
+def last_day_readings(data):
+    """Returns every reading taken on the last day seen for each turnstile."""
+
+    day = data.datetime.dt.normalize()
+    last_day = day.groupby([data[col] for col in DEVICE_COLS], observed=True).transform('max')
+    return data[day == last_day]
+
+def first_day_readings(data, days=1):
+    """Returns every reading taken on the first day (or first days) seen for each turnstile."""
+
+    day = data.datetime.dt.normalize()
+    day_number = day.groupby([data[col] for col in DEVICE_COLS], observed=True).rank(method='dense')
+    return data[day_number <= days]
+
+def readings_since(data, start_date=None):
+    """Drops the readings taken before start_date (X/X/XXXX), as a full build does, when one is given."""
+
+    if start_date is None:
+        return data
+    return data[data.datetime >= pd.to_datetime(start_date, format="%m/%d/%Y")]
+
+def load_tail(root=STORE_DIR):
+    path = os.path.join(root, TAIL_FILE)
+    return pd.read_parquet(path) if os.path.exists(path) else None
+
+def save_tail(tail, root=STORE_DIR):
+    os.makedirs(root, exist_ok=True)
+    tail.to_parquet(os.path.join(root, TAIL_FILE), index=False)
+
+def new_outlier_filters():
+    return OutlierFilter('daily_entries', DAILY_QUANTILE), OutlierFilter('hourly_entries', HOURLY_QUANTILE)
+
+def load_outlier_filters(root=STORE_DIR):
+    """Returns the daily and hourly outlier filters kept in the store, or new ones if there are none."""
+
+    try:
+        with open(os.path.join(root, OUTLIERS_FILE)) as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return new_outlier_filters()
+    return OutlierFilter.from_dict(state['daily']), OutlierFilter.from_dict(state['hourly'])
+
+def save_outlier_filters(daily_outliers, hourly_outliers, root=STORE_DIR):
+    os.makedirs(root, exist_ok=True)
+    tmp_path = os.path.join(root, OUTLIERS_FILE + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump({'daily': daily_outliers.to_dict(), 'hourly': hourly_outliers.to_dict()}, f)
+    os.replace(tmp_path, os.path.join(root, OUTLIERS_FILE))
+
+def load_outlier_report(root=STORE_DIR):
+    """
+    Returns the outlier report kept in the store: per dataset, the compare_to_exact report of each week,
+    keyed by its week partition (YYYY-MM-DD) in a chunked build and by its file (YYMMDD) in an incremental run.
+    """
+
+    try:
+        with open(os.path.join(root, OUTLIER_REPORT_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'daily': {}, 'hourly': {}}
+
+def save_outlier_report(report, root=STORE_DIR):
+    os.makedirs(root, exist_ok=True)
+    tmp_path = os.path.join(root, OUTLIER_REPORT_FILE + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(report, f, indent=1)
+    os.replace(tmp_path, os.path.join(root, OUTLIER_REPORT_FILE))
+
+def print_outlier_report(report, weeks):
+    """Prints how many rows of weeks the outlier cut keeps differently from the exact quantiles of each week."""
+
+    differing = {name: sum(report[name][week]['rows_differing'] for week in weeks if week in report[name])
+                 for name in ('daily', 'hourly')}
+    print(f"Outlier cut over {len(weeks)} weeks: {differing['daily']} daily and {differing['hourly']} hourly rows "
+          "differ from the exact quantiles of their week.")
+
+def record_ingest_state(saturday_list, tail, daily_outliers, hourly_outliers, root=STORE_DIR, start_date=None):
+    """
+    Records the weeks built from start_date (X/X/XXXX) on, their tail and outlier sketches so that
+    later runs can ingest incrementally.
+    """
+
+    save_outlier_filters(daily_outliers, hourly_outliers, root)
+    if tail is not None:
+        save_tail(tail, root)
+    save_manifest({week_key(saturday) for saturday in saturday_list}, start_date, root)
+
+@instrumented
+def week_deltas(week, tail):
+    """
+    Returns the daily and hourly deltas that a new week adds to the weeks before it, given their tail,
+    along with the new tail. The tail's last day is held back by the previous week, as its entries
+    are only known once the next week arrives.
+    """
+
+    batch = week if tail is None else concat_weeks([tail, week])
+    daily, hourly = daily_and_hourly_deltas(batch)
+    hourly = hourly[hourly.datetime >= week.datetime.min()]
+    return daily, hourly, last_day_readings(batch)
+
+@instrumented
+def ingest_new_weeks(saturday_list, locations, root=STORE_DIR, source=None, cache=None, start_date=None):
+    """
+    Fetches, cleans and appends only the weeks of saturday_list missing from the manifest, leaving out
+    readings before start_date (X/X/XXXX) as a full build does. Once the store has weeks, the start
+    date recorded in its manifest is kept, and see check_appendable for the weeks that are refused.
+    locations must already be cleaned and have normalized stop names. Returns the weeks ingested.
+    """
+
+    ingested, ingested_start = load_manifest(root)
+    check_appendable(saturday_list, start_date, ingested, ingested_start)
+    if ingested:
+        start_date = ingested_start
+    new_saturdays = [saturday for saturday in saturday_list if week_key(saturday) not in ingested]
+
+    stations = build_station_dimension(locations)
+    daily_outliers, hourly_outliers = load_outlier_filters(root)
+    report = load_outlier_report(root)
+    appendable = has_device_store(root)
+
+    #readings the first new file repeats from the last one ingested are looked up in the stored tail,
+    #which has normalized station names, so the new readings are checked once their names are normalized too
+    seen = DuplicateFilter(window=DUPLICATE_WINDOW)
+    tail = load_tail(root)
+    if tail is not None:
+        seen.add(reading_keys(tail), tail.datetime)
+
+    for saturday, week in stream_weeks(new_saturdays, source=source, cache=cache):
+        week = attach_stations(normalize_mta_station_names(readings_since(week, start_date)), stations)
+        week = remove_duplicates(week, verbose=False, seen=seen)
+        if week.empty:
+            ingested.add(week_key(saturday))
+            save_manifest(ingested, start_date, root)
+            continue
+        write_table(week, 'locations', root, append=True)
+
+        daily, hourly, tail = week_deltas(week, load_tail(root))
+        daily_outliers.update(daily)
+        hourly_outliers.update(hourly)
+        report['daily'][week_key(saturday)] = compare_to_exact(daily, daily_outliers)
+        report['hourly'][week_key(saturday)] = compare_to_exact(hourly, hourly_outliers)
+        daily = finish_daily_dataset(daily, daily_outliers, update=False)
+        hourly = finish_hourly_dataset(hourly, hourly_outliers, update=False)
+
+        write_table(daily, 'daily', root, append=True)
+        write_table(hourly, 'hourly', root, append=True)
+        if appendable and not hourly.empty:
+            append_device_segment(hourly, root)
+        TrafficCube.load(root).merge(TrafficCube.build(daily, hourly)).save(root)
+
+        save_outlier_filters(daily_outliers, hourly_outliers, root)
+        save_outlier_report(report, root)
+        save_tail(tail, root)
+        ingested.add(week_key(saturday))
+        save_manifest(ingested, start_date, root)
+
+    if new_saturdays:
+        print_outlier_report(report, [week_key(saturday) for saturday in new_saturdays])
+    if not appendable and list_partitions('hourly', root):
+        build_device_store(root)
+
+    return new_saturdays
@@ -0,0 +1,256 @@
+import functools
+import json
+import platform
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+"""
+Stage timing and instrumentation for the pipeline and the analysis functions.
+
+Functions decorated with @instrumented, and blocks wrapped in stage(), are recorded while a RunReport
+is active and cost a single check otherwise. Per stage the report keeps the wall time, rows and bytes
+in and out (the first DataFrame argument and the returned frames; bytes are shallow, as memory_usage()
+without deep), the process peak RSS and, with trace_memory, the peak memory traced during the stage.
+Stages nested in other stages are recorded under their parent's name (e.g. pipeline.build_full/load.mta_to_df)
+and repeated calls of a stage are added up, so reports of two runs can be compared stage by stage.
+
+    with RunReport(trace_memory=True, profile='cprofile') as report:
+        build_full('04/01/2019', '04/30/2019')
+    report.save('run.json')   # also writes run.prof with the cProfile stats
+"""
+
+_report = None
+_local = threading.local()
+
+def peak_rss_mb():
+    """Returns the peak resident set size of this process so far, in megabytes."""
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+    return peak / 1024**2 if sys.platform == 'darwin' else peak / 1024
+
+def _size(obj):
+    """Returns (rows, bytes) of a DataFrame, Series or Arrow table, or of a tuple/list of them, else (None, None)."""
+
+    if isinstance(obj, (tuple, list)):
+        sizes = [_size(item) for item in obj]
+        sizes = [size for size in sizes if size[0] is not None]
+        if not sizes:
+            return None, None
+        return sum(rows for rows, _ in sizes), sum(nbytes for _, nbytes in sizes)
+    if hasattr(obj, 'memory_usage') and hasattr(obj, 'index'):
+        usage = obj.memory_usage()
+        return len(obj), int(usage.sum() if hasattr(usage, 'sum') else usage)
+    if hasattr(obj, 'num_rows') and hasattr(obj, 'nbytes'):
+        return obj.num_rows, obj.nbytes
+    return None, None
+
+class StageRecord:
+    """Measurements of one stage, added up over its calls."""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.wall_s = 0.0
+        self.rows_in = None
+        self.rows_out = None
+        self.bytes_in = None
+        self.bytes_out = None
+        self.peak_traced_mb = None
+        self.peak_rss_mb = None
+
+    def add(self, field, value):
+        if value is not None:
+            setattr(self, field, (getattr(self, field) or 0) + value)
+
+    def to_dict(self):
+        return dict(vars(self))
+
+class _Call:
+    """A running stage. output() records what the stage returned."""
+
+    def __init__(self, record, data):
+        self.record = record
+        self.rows_in, self.bytes_in = _size(data)
+        self.rows_out = self.bytes_out = None
+        self.peak = 0
+
+    def output(self, data):
+        self.rows_out, self.bytes_out = _size(data)
+        return data
+
+class RunReport:
+    """
+    Collects the stage records of a run while it is active (with report: ...). trace_memory turns on
+    tracemalloc for per-stage peak memory, which slows the run down. profile='cprofile' or 'pyinstrument'
+    also profiles the whole run, and save() writes the profile next to the report.
+    """
+
+    def __init__(self, trace_memory=False, profile=None):
+        if profile not in (None, 'cprofile', 'pyinstrument'):
+            raise ValueError(f"Unknown profiler: {profile}")
+        self.trace_memory = trace_memory
+        self.profile = profile
+        self.records = {}
+        self.started_at = None
+        self.wall_s = None
+        self._lock = threading.Lock()
+        self._profiler = None
+
+    def __enter__(self):
+        global _report
+        if _report is not None:
+            raise RuntimeError("Another RunReport is already active.")
+        if self.trace_memory:
+            tracemalloc.start()
+        if self.profile == 'cprofile':
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif self.profile == 'pyinstrument':
+            from pyinstrument import Profiler
+            self._profiler = Profiler()
+            self._profiler.start()
+        self.started_at = time.strftime('%Y-%m-%dT%H:%M:%S%z')
+        self._start = time.perf_counter()
+        _report = self
+        return self
+
+    def __exit__(self, *exc):
+        global _report
+        _report = None
+        self.wall_s = time.perf_counter() - self._start
+        if self.profile == 'cprofile':
+            self._profiler.disable()
+        elif self.profile == 'pyinstrument':
+            self._profiler.stop()
+        if self.trace_memory:
+            tracemalloc.stop()
+        return False
+
+    def record(self, name):
+        with self._lock:
+            if name not in self.records:
+                self.records[name] = StageRecord(name)
+            return self.records[name]
+
+    def to_dict(self):
+        import numpy as np
+        import pandas as pd
+
+        versions = {'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__}
+        try:
+            import pyarrow
+            versions['pyarrow'] = pyarrow.__version__
+        except ImportError:
+            pass
+
+        return {'started_at': self.started_at,
+                'argv': sys.argv,
+                'versions': versions,
+                'wall_s': self.wall_s,
+                'peak_rss_mb': peak_rss_mb(),
+                'stages': [record.to_dict() for record in self.records.values()]}
+
+    def save(self, path):
+        """Writes the report as JSON to path, and the profile (if any) to path with a .prof or .html suffix."""
+
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=1)
+
+        stem = path[:-len('.json')] if path.endswith('.json') else path
+        if self.profile == 'cprofile':
+            self._profiler.dump_stats(stem + '.prof')
+        elif self.profile == 'pyinstrument':
+            with open(stem + '.html', 'w') as f:
+                f.write(self._profiler.output_html())
+
+@contextmanager
+def stage(name, data=None):
+    """
+    Records the block as a stage of the active report, with data as its input. Use the yielded
+    call's output() to record what the block produced. Does nothing when no report is active.
+    """
+
+    report = _report
+    if report is None:
+        yield _Call(None, None)
+        return
+
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    if stack:
+        name = f"{stack[-1].record.name}/{name}"
+    call = _Call(report.record(name), data)
+
+    if report.trace_memory:
+        if stack:
+            stack[-1].peak = max(stack[-1].peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+    stack.append(call)
+    start = time.perf_counter()
+    try:
+        yield call
+    finally:
+        wall_s = time.perf_counter() - start
+        stack.pop()
+        record = call.record
+        with report._lock:
+            record.calls += 1
+            record.wall_s += wall_s
+            record.add('rows_in', call.rows_in)
+            record.add('bytes_in', call.bytes_in)
+            record.add('rows_out', call.rows_out)
+            record.add('bytes_out', call.bytes_out)
+            record.peak_rss_mb = peak_rss_mb()
+            if report.trace_memory:
+                peak = max(call.peak, tracemalloc.get_traced_memory()[1]) / 1024**2
+                record.peak_traced_mb = max(record.peak_traced_mb or 0, peak)
+                if stack:
+                    stack[-1].peak = max(stack[-1].peak, peak * 1024**2)
+
+def _first_frame(args, kwargs):
+    for arg in list(args) + list(kwargs.values()):
+        if _size(arg)[0] is not None:
+            return arg
+    return None
+
+def instrumented(func):
+    """Records every call of func as a stage (named module.function) while a RunReport is active."""
+
+    name = f"{func.__module__.rsplit('.', 1)[-1]}.{func.__qualname__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _report is None:
+            return func(*args, **kwargs)
+        with stage(name, _first_frame(args, kwargs)) as call:
+            return call.output(func(*args, **kwargs))
+
+    return wrapper
+
+def load_report(path):
+    with open(path) as f:
+        return json.load(f)
+
+def compare_reports(old, new):
+    """
+    Compares two saved reports (paths or loaded dicts) stage by stage. Returns a DataFrame with the
+    wall time, rows out and peak memory of each stage in both runs and the ratio of the wall times.
+    """
+
+    import pandas as pd
+
+    old = load_report(old) if isinstance(old, str) else old
+    new = load_report(new) if isinstance(new, str) else new
+    columns = ['name', 'calls', 'wall_s', 'rows_out', 'peak_traced_mb', 'peak_rss_mb']
+    old_stages = pd.DataFrame(old['stages'], columns=columns).set_index('name')
+    new_stages = pd.DataFrame(new['stages'], columns=columns).set_index('name')
+    comparison = old_stages.join(new_stages, how='outer', lsuffix='_old', rsuffix='_new')
+    comparison['wall_ratio'] = comparison.wall_s_new / comparison.wall_s_old
+    return comparison.reset_index()
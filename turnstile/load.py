@@ -0,0 +1,55 @@
+from turnstile.cleaning import DuplicateFilter, basic_df_cleaning, remove_duplicates
+from turnstile.fetch import fetch_weeks
+from turnstile.instrument import instrumented, peak_rss_mb
+from turnstile.schema import concat_weeks, read_turnstile
+
+"""
+Streaming loader for the weekly MTA turnstile files.
+
+Each week is read, cleaned and de-duplicated on its own and the cleaned weeks are
+concatenated once at the end, instead of growing one frame with a concat per week.
+"""
+
+# weekly files only overlap at their edges, so duplicates across weeks are looked for within a day
+DUPLICATE_WINDOW = '1D'
+
+@instrumented
+def import_mta(path):
+    """reads in a weekly MTA turnstile file that has been fetched into the local cache"""
+
+    date_data = read_turnstile(path)
+    return date_data
+
+def stream_weeks(saturday_list, source=None, cache=None, max_workers=8, seen=None):
+    """
+    Yields (saturday, cleaned and de-duplicated week of data) one week at a time.
+    Readings repeated across neighbouring weeks are dropped too; pass a DuplicateFilter as seen
+    to read back how many were dropped (seen.dropped) or to carry it over between calls.
+    """
+
+    seen = seen if seen is not None else DuplicateFilter(window=DUPLICATE_WINDOW)
+    paths = fetch_weeks(saturday_list, source=source, cache=cache, max_workers=max_workers)
+    for saturday in saturday_list:
+        week = basic_df_cleaning(import_mta(paths[saturday]))
+        yield saturday, remove_duplicates(week, verbose=False, seen=seen)
+
+@instrumented
+def mta_to_df(saturday_list, source=None, cache=None, max_workers=8, memory_budget_mb=None):
+    """
+    imports MTA turnstile data for a list of dates, cleans each week as it is read and
+    concatenates the weeks once at the end. Reports the peak RSS of the load and warns
+    when it exceeds memory_budget_mb.
+    """
+
+    seen = DuplicateFilter(window=DUPLICATE_WINDOW)
+    weeks = [week for _, week in stream_weeks(saturday_list, source=source, cache=cache,
+                                                max_workers=max_workers, seen=seen)]
+    mta = concat_weeks(weeks)
+    del weeks
+
+    peak = peak_rss_mb()
+    print(f"Loaded {len(mta)} rows from {len(saturday_list)} weeks ({seen.dropped} duplicates dropped). Peak RSS: {peak:.0f} MB.")
+    if memory_budget_mb is not None and peak > memory_budget_mb:
+        print(f"Warning: peak RSS of {peak:.0f} MB exceeded the memory budget of {memory_budget_mb} MB.")
+
+    return mta
@@ -0,0 +1,179 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+"""
+Streaming outlier filter for the daily and hourly entries.
+
+The exact filter keeps values below one global quantile of the fully loaded dataset. The
+filter here keeps the same cut, but estimates the quantile with a mergeable sketch, so data
+can be filtered chunk by chunk (or week by week) in bounded memory, and sketches built on
+separate chunks can be merged. The sketch buckets values logarithmically (as in DDSketch), so
+every quantile estimate is within relative_accuracy of a value in the data.
+"""
+
+class QuantileSketch:
+    """Mergeable quantile sketch over non-negative values with a relative accuracy guarantee."""
+
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zeros = 0
+        self.count = 0
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        self.count += len(values)
+        self.zeros += int((values <= 0).sum())
+
+        keys, counts = np.unique(np.ceil(np.log(values[values > 0]) / self.log_gamma).astype(np.int64),
+                                 return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        return self
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Only sketches with the same relative accuracy can be merged.")
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+        return self
+
+    def quantile(self, q):
+        if self.count == 0:
+            return np.nan
+
+        rank = q * (self.count - 1)
+        if rank < self.zeros:
+            return 0.0
+        seen = self.zeros
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                return 2 * self.gamma**key / (self.gamma + 1)
+        return 2 * self.gamma**max(self.buckets) / (self.gamma + 1)
+
+    def to_dict(self):
+        return {'relative_accuracy': self.relative_accuracy, 'zeros': self.zeros, 'count': self.count,
+                'buckets': {str(key): count for key, count in self.buckets.items()}}
+
+    @classmethod
+    def from_dict(cls, state):
+        sketch = cls(state['relative_accuracy'])
+        sketch.zeros = state['zeros']
+        sketch.count = state['count']
+        sketch.buckets = {int(key): count for key, count in state['buckets'].items()}
+        return sketch
+
+class OutlierFilter:
+    """
+    Keeps the rows whose column is below its q-quantile. The quantile is taken over every chunk the
+    filter has been updated with, either over all rows or per group of the by column (e.g. station).
+    """
+
+    def __init__(self, column, q, by=None, relative_accuracy=0.01):
+        self.column = column
+        self.q = q
+        self.by = by
+        self.relative_accuracy = relative_accuracy
+        self.sketches = {}
+
+    def _sketch(self, group):
+        if group not in self.sketches:
+            self.sketches[group] = QuantileSketch(self.relative_accuracy)
+        return self.sketches[group]
+
+    def update(self, data):
+        if self.by is None:
+            self._sketch(None).update(data[self.column])
+        else:
+            for group, values in data.groupby(self.by, observed=True)[self.column]:
+                self._sketch(group).update(values)
+        return self
+
+    def merge(self, other):
+        for group, sketch in other.sketches.items():
+            self._sketch(group).merge(sketch)
+        return self
+
+    def thresholds(self):
+        return {group: sketch.quantile(self.q) for group, sketch in self.sketches.items()}
+
+    def _limits(self, data):
+        """Returns the threshold of each row's group (NaN for groups the filter has not seen)."""
+
+        thresholds = self.thresholds()
+        if isinstance(self.by, list):
+            # groups of several columns are tuples, looked up through a MultiIndex of the rows
+            groups = pd.MultiIndex.from_tuples(list(thresholds), names=self.by)
+            rows = pd.MultiIndex.from_frame(data[self.by])
+        else:
+            groups = pd.Index(list(thresholds))
+            rows = pd.Index(data[self.by])
+        # unseen groups get position -1, which picks the NaN appended at the end
+        limits = np.append(np.fromiter(thresholds.values(), dtype=float, count=len(thresholds)), np.nan)
+        return limits[groups.get_indexer(rows)]
+
+    def apply(self, data):
+        if self.by is None:
+            return data[data[self.column] < self.thresholds().get(None, np.nan)]
+        return data[data[self.column].to_numpy(dtype=float) < self._limits(data)]
+
+    def update_and_apply(self, data):
+        return self.update(data).apply(data)
+
+    def to_dict(self):
+        return {'column': self.column, 'q': self.q, 'by': self.by, 'relative_accuracy': self.relative_accuracy,
+                'sketches': [[_json_group(group), sketch.to_dict()] for group, sketch in self.sketches.items()]}
+
+    @classmethod
+    def from_dict(cls, state):
+        outliers = cls(state['column'], state['q'], by=state['by'], relative_accuracy=state['relative_accuracy'])
+        # JSON turns the tuples of multi-column groups into lists, which cannot be dict keys
+        outliers.sketches = {tuple(group) if isinstance(group, list) else group: QuantileSketch.from_dict(sketch)
+                             for group, sketch in state['sketches']}
+        return outliers
+
+def _json_group(group):
+    if isinstance(group, tuple):
+        return [_json_group(value) for value in group]
+    return group.item() if isinstance(group, np.generic) else group
+
+def compare_to_exact(data, outliers):
+    """
+    Reports how far a fitted filter is from the exact quantile filter on data (per group of the
+    filter's by column, if it has one): the exact and estimated thresholds and the rows the two
+    filters keep differently. With groups, the largest relative error over the groups is reported.
+    """
+
+    values = data[outliers.column]
+    if outliers.by is None:
+        exact_threshold = values.quantile(q=outliers.q)
+        exact_keep = values < exact_threshold
+    else:
+        groups = values.groupby([data[col] for col in np.atleast_1d(outliers.by)], observed=True)
+        exact_keep = values < groups.transform('quantile', q=outliers.q)
+    sketch_keep = pd.Series(False, index=data.index)
+    sketch_keep[outliers.apply(data).index] = True
+
+    report = {'rows': len(data),
+              'exact_rows_kept': int(exact_keep.sum()),
+              'sketch_rows_kept': int(sketch_keep.sum()),
+              'rows_differing': int((exact_keep != sketch_keep).sum())}
+    if outliers.by is None:
+        estimate = outliers.thresholds().get(None, np.nan)
+        report['exact_threshold'] = float(exact_threshold)
+        report['sketch_threshold'] = float(estimate)
+        report['threshold_relative_error'] = float(abs(estimate - exact_threshold) / exact_threshold)
+    else:
+        exact = groups.quantile(q=outliers.q)
+        estimates = pd.Series(outliers.thresholds(), dtype=float).reindex(exact.index)
+        report['groups'] = len(exact)
+        report['max_threshold_relative_error'] = float(((estimates - exact).abs() / exact).max())
+    return report
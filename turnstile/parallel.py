@@ -0,0 +1,159 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from turnstile.cleaning import DuplicateFilter, basic_df_cleaning, reading_keys, remove_duplicates
+from turnstile.cube import TrafficCube
+from turnstile.deltas import DEVICE_COLS, daily_and_hourly_deltas
+from turnstile.devicestore import build_device_store
+from turnstile.features import finish_daily_dataset, finish_hourly_dataset
+from turnstile.fetch import fetch_weeks
+from turnstile.ingest import (first_day_readings, last_day_readings, new_outlier_filters, readings_since, record_ingest_state,
+                              week_deltas)
+from turnstile.instrument import instrumented
+from turnstile.load import DUPLICATE_WINDOW, import_mta
+from turnstile.schema import concat_weeks
+from turnstile.stations import attach_stations, build_station_dimension, normalize_mta_station_names
+from turnstile.store import STORE_DIR, clear_table, write_table
+
+"""
+Multi-core build of the daily and hourly datasets.
+
+Weeks are independent up to their boundaries, so each week is cleaned, de-duplicated, matched
+to its stations and turned into daily and hourly deltas in a worker process. Workers append their
+week of merged readings straight to the store and send the deltas back as Arrow IPC streams
+rather than pickled DataFrames. The deltas that straddle two weeks (the last day of a week, the
+first day of the next, which may have started in the previous file, and its first audit) are
+computed in the parent from the tail of the weeks before and each week's first two days.
+
+Neighbouring files can repeat readings at their edges, which a worker cannot see on its own. The
+readings within DUPLICATE_WINDOW of the start of a week are therefore sent to the parent instead
+of being written by the worker, and the parent drops those the tail already has before writing them.
+"""
+
+_stations = None
+
+def _init_worker(stations):
+    global _stations
+    _stations = stations
+
+def _to_arrow(data):
+    sink = pa.BufferOutputStream()
+    table = pa.Table.from_pandas(data, preserve_index=False)
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+def _from_arrow(buffer):
+    return pa.ipc.open_stream(buffer).read_all().to_pandas()
+
+def _process_week(path, root, start_date):
+    """
+    Runs the per-week stages in a worker and returns the daily/hourly deltas, the week's first two
+    days, its last day and the readings of its leading edge, which are left for the parent to write
+    (None if no reading is left after start_date). The daily entries of each turnstile's first day
+    are left to the parent.
+    """
+
+    week = readings_since(remove_duplicates(basic_df_cleaning(import_mta(path)), verbose=False), start_date)
+    if week.empty:
+        return None
+    week = attach_stations(normalize_mta_station_names(week), _stations)
+    at_edge = (week.datetime < week.datetime.min() + pd.Timedelta(DUPLICATE_WINDOW)).to_numpy()
+    if root is not None:
+        write_table(week[~at_edge], 'locations', root, append=True)
+
+    daily, hourly = daily_and_hourly_deltas(week)
+    first_day = week.groupby(DEVICE_COLS, observed=True)['datetime'].min().dt.normalize().rename('first_day').reset_index()
+    daily = daily.merge(first_day, on=DEVICE_COLS)
+    daily = daily[daily.datetime > daily.first_day].drop(columns='first_day')
+    return tuple(_to_arrow(data) for data in (daily, hourly, first_day_readings(week, days=2), last_day_readings(week),
+                                              week[at_edge]))
+
+def repeated_readings(data, tail):
+    """Returns a mask of the readings of data that the tail of the weeks before already has."""
+
+    if tail is None:
+        return np.zeros(len(data), dtype=bool)
+    seen = DuplicateFilter()
+    seen.add(reading_keys(tail), tail.datetime)
+    return seen.seen(reading_keys(data))
+
+def boundary_deltas(tail, head):
+    """
+    Returns the deltas across a week boundary: the daily entries of the tail's last day and of the
+    head's first day (the head being the next week's first two days), and the hourly entries of the
+    first audit of each turnstile in the head. tail is None before the first week.
+    """
+
+    daily, hourly, _ = week_deltas(head, tail)
+    return daily, hourly[_first_audit(hourly, head) == hourly.datetime.to_numpy()]
+
+def _first_audit(data, head):
+    """The first audit in the head of the turnstile of each row of data."""
+
+    first_audit = head.groupby(DEVICE_COLS, observed=True)['datetime'].min().rename('first_audit').reset_index()
+    return data[DEVICE_COLS].merge(first_audit, on=DEVICE_COLS, how='left').first_audit.to_numpy()
+
+@instrumented
+def prepare_datasets_parallel(saturday_list, locations, max_workers=None, root=None, source=None, cache=None,
+                              start_date=None):
+    """
+    Builds the daily and hourly datasets for saturday_list with the per-week work spread over
+    max_workers processes (default: one per core), leaving out readings before start_date (X/X/XXXX).
+    When root is given, the store's locations dataset is replaced by the merged readings the workers write.
+    Returns the daily and hourly datasets and the last day of readings (the tail for incremental ingest).
+    """
+
+    paths = fetch_weeks(saturday_list, source=source, cache=cache)
+    stations = build_station_dimension(locations)
+    if root is not None:
+        clear_table('locations', root)
+
+    dailies, hourlies = [], []
+    tail = None
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(stations,)) as pool:
+        results = pool.map(_process_week, [paths[saturday] for saturday in saturday_list], [root] * len(saturday_list),
+                           [start_date] * len(saturday_list))
+        for buffers in results:
+            if buffers is None:
+                continue
+            daily, hourly, head, week_tail, edge = (_from_arrow(buffer) for buffer in buffers)
+
+            #readings the previous file already had are dropped from this week's output
+            if root is not None:
+                write_table(edge[~repeated_readings(edge, tail)], 'locations', root, append=True)
+            head = head[~repeated_readings(head, tail)]
+            #the hourly entries up to each turnstile's first audit come from the boundary
+            hourly = hourly[hourly.datetime.to_numpy() > _first_audit(hourly, head)]
+
+            boundary_daily, boundary_hourly = boundary_deltas(tail, head)
+            dailies += [boundary_daily, daily]
+            hourlies += [boundary_hourly, hourly]
+            #turnstiles missing from this week keep their last day from the weeks before
+            tail = last_day_readings(concat_weeks([tail, week_tail])) if tail is not None else week_tail
+
+    return concat_weeks(dailies), concat_weeks(hourlies), tail
+
+@instrumented
+def build_parallel(saturday_list, locations, max_workers=None, root=STORE_DIR, source=None, cache=None, start_date=None):
+    """Builds the store (merged readings, daily and hourly datasets, traffic cubes and device store) with prepare_datasets_parallel."""
+
+    daily, hourly, tail = prepare_datasets_parallel(saturday_list, locations, max_workers=max_workers, root=root,
+                                                    source=source, cache=cache, start_date=start_date)
+
+    #every delta is in memory, so outliers are cut at the exact quantile as in a full build; the sketches are kept for incremental ingest
+    daily_outliers, hourly_outliers = new_outlier_filters()
+    daily_outliers.update(daily)
+    hourly_outliers.update(hourly)
+    daily = finish_daily_dataset(daily)
+    hourly = finish_hourly_dataset(hourly)
+    clear_table('daily', root)
+    clear_table('hourly', root)
+    write_table(daily, 'daily', root)
+    write_table(hourly, 'hourly', root)
+    TrafficCube.build(daily, hourly).save(root)
+    build_device_store(root)
+    record_ingest_state(saturday_list, tail, daily_outliers, hourly_outliers, root, start_date)
@@ -0,0 +1,135 @@
+from turnstile.cube import TrafficCube
+from turnstile.deltas import daily_and_hourly_deltas
+from turnstile.devicestore import build_device_store
+from turnstile.features import finish_daily_dataset, finish_hourly_dataset
+from turnstile.fetch import all_saturdays
+from turnstile.ingest import last_day_readings, new_outlier_filters, readings_since, record_ingest_state
+from turnstile.instrument import instrumented
+from turnstile.load import mta_to_df
+from turnstile.stations import (STATIONS_URL, attach_stations, build_station_dimension, clean_location_data,
+                                import_location_data, normalize_mta_station_names, normalize_stop_names,
+                                report_station_names)
+from turnstile.store import STORE_DIR, clear_table, read_table, write_table
+
+"""
+The stages of a full build of the store, as functions that can be called on their own.
+
+1. import and clean MTA turnstyle data
+2. import and clean MTA subway location data
+3. merge the two datasets and save the output to the columnar store
+4. engineer the daily + hourly datasets and save them (and the traffic cubes and device store) to the columnar store
+
+build_daily and build_hourly redo step 4 for one dataset from the merged data already in the store.
+"""
+
+# columns of the merged data the daily and hourly datasets are computed from
+LOCATION_COLUMNS = ['c_a', 'unit', 'scp', 'station', 'station_id', 'borough', 'datetime', 'entries']
+
+@instrumented
+def import_data(start_date, end_date, source=None, cache=None):
+    """Imports and cleans the MTA turnstile data from start_date to end_date (X/X/XXXX)."""
+
+    # each week is cleaned and de-duplicated (also against the previous week) as it is loaded
+    saturday_list = all_saturdays(start_date, end_date)
+    mta = mta_to_df(saturday_list, source=source, cache=cache)
+
+    # to keep only the specified dates rather than saturday-saturday
+    mta = readings_since(mta, start_date)
+
+    return mta, saturday_list
+
+@instrumented
+def load_locations(path=STATIONS_URL):
+    """Imports and cleans the MTA subway location data, with stop names normalized for the merge."""
+
+    return normalize_stop_names(clean_location_data(import_location_data(path)))
+
+@instrumented
+def merge_and_save(mta, locations, root=STORE_DIR):
+    """Merges the turnstile data with the locations and saves the result to the store as 'locations'."""
+
+    #several of the names in the datasets are not consistent. Adjustments are made to the datasets prior to merging.
+    mta = normalize_mta_station_names(mta)
+
+    #report renames that collide and stations that would be silently dropped by the merge
+    report_station_names(mta, locations)
+
+    #build the station dimension once and look up each reading's station by index rather than merging on names
+    mta_locations = attach_stations(mta, build_station_dimension(locations))
+    clear_table('locations', root)
+    write_table(mta_locations, 'locations', root)
+
+    return mta_locations
+
+@instrumented
+def build_datasets(mta_locations, root=STORE_DIR, daily_outliers=None, hourly_outliers=None):
+    """
+    Builds the daily and hourly datasets, the traffic cubes and the device store and saves them to the store.
+    Outliers are cut at the exact quantile; daily_outliers and hourly_outliers, if given, are only updated
+    with the deltas, for incremental ingest to carry on from.
+    """
+
+    #daily and hourly entries are computed from a single sort of the readings
+    mta_daily, mta_hourly = daily_and_hourly_deltas(mta_locations)
+    if daily_outliers is not None:
+        daily_outliers.update(mta_daily)
+    if hourly_outliers is not None:
+        hourly_outliers.update(mta_hourly)
+    mta_daily = finish_daily_dataset(mta_daily)
+    mta_hourly = finish_hourly_dataset(mta_hourly)
+
+    #weeks of an earlier build that are not in this one must not be left behind
+    clear_table('daily', root)
+    clear_table('hourly', root)
+    write_table(mta_daily, 'daily', root)
+    write_table(mta_hourly, 'hourly', root)
+
+    #materialize the station x week / day of week / hour cubes the analysis scripts query
+    TrafficCube.build(mta_daily, mta_hourly).save(root)
+
+    #lay the hourly dataset out by turnstile and time for station queries that only read their slices
+    build_device_store(root)
+
+    return mta_daily, mta_hourly
+
+@instrumented
+def build_full(start_date, end_date, root=STORE_DIR, stations_path=STATIONS_URL, source=None, cache=None):
+    """Rebuilds the whole store for the dates from start_date to end_date (X/X/XXXX)."""
+
+    mta, saturday_list = import_data(start_date, end_date, source=source, cache=cache)
+    mta_locations = merge_and_save(mta, load_locations(stations_path), root)
+    daily_outliers, hourly_outliers = new_outlier_filters()
+    build_datasets(mta_locations, root, daily_outliers, hourly_outliers)
+
+    # record the ingested weeks so that later runs only need to ingest newly published weeks
+    record_ingest_state(saturday_list, last_day_readings(mta_locations), daily_outliers, hourly_outliers, root,
+                        start_date)
+
+@instrumented
+def stored_deltas(root=STORE_DIR):
+    """Returns the daily and hourly deltas of the merged data already in the store."""
+
+    return daily_and_hourly_deltas(read_table('locations', root, columns=LOCATION_COLUMNS))
+
+@instrumented
+def build_daily(root=STORE_DIR):
+    """Rebuilds the daily dataset and its cubes from the merged data in the store."""
+
+    mta_daily = finish_daily_dataset(stored_deltas(root)[0])
+    clear_table('daily', root)
+    write_table(mta_daily, 'daily', root)
+    TrafficCube.load(root).replace(TrafficCube.build(mta_daily, None)).save(root)
+
+    return mta_daily
+
+@instrumented
+def build_hourly(root=STORE_DIR):
+    """Rebuilds the hourly dataset, its cube and the device store from the merged data in the store."""
+
+    mta_hourly = finish_hourly_dataset(stored_deltas(root)[1])
+    clear_table('hourly', root)
+    write_table(mta_hourly, 'hourly', root)
+    TrafficCube.load(root).replace(TrafficCube.build(None, mta_hourly)).save(root)
+    build_device_store(root)
+
+    return mta_hourly
@@ -0,0 +1,212 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from turnstile.instrument import instrumented
+
+"""
+Plots of the analysis, saved as PNG files.
+
+Each plot is a Figure: the pre-aggregated table it draws, the function that draws it and the file
+it is saved to. render_figures draws a batch of figures with matplotlib's headless Agg backend in
+a process pool and keeps a hash of every figure's inputs next to the PNG files, so rendering the
+deck again after a data refresh only redraws the charts whose inputs changed.
+
+matplotlib and seaborn are imported where the figures are drawn, so the data stages and the command
+line can import this package without loading the plotting stack.
+"""
+
+BRAND_BLUE = '#042263FF'
+PEAK_DAYS = ['Tuesday', 'Wednesday', 'Thursday', 'Friday']
+FIGURE_HASHES = '.figure_hashes.json'
+
+def _pyplot():
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    return plt, sns
+
+class Figure:
+    """A plot to render: draw(plt, sns, data, **options) draws data on a new figure, which is saved as filename."""
+
+    def __init__(self, filename, draw, data, figsize, **options):
+        self.filename = filename
+        self.draw = draw
+        self.data = data
+        self.figsize = figsize
+        self.options = options
+
+    def digest(self):
+        """sha256 of the data, options and drawing code of the figure."""
+
+        digest = hashlib.sha256()
+        digest.update(repr((self.filename, self.figsize, sorted(self.options.items()))).encode())
+        digest.update(self.draw.__code__.co_code + repr(self.draw.__code__.co_consts).encode())
+        data = self.data.to_frame() if isinstance(self.data, pd.Series) else self.data
+        digest.update(repr((list(data.columns), list(data.dtypes.astype(str)), list(data.index))).encode())
+        digest.update(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes())
+        return digest.hexdigest()
+
+def _render(figure, out_dir):
+    plt, sns = _pyplot()
+
+    # the style is set before every figure so that a figure looks the same whichever worker draws it
+    sns.set_style('white')
+    sns.set_palette("Set2")
+    plt.figure(figsize=figure.figsize)
+    figure.draw(plt, sns, figure.data, **figure.options)
+
+    path = os.path.join(out_dir, figure.filename)
+    plt.savefig(path)
+    plt.close()
+    return path
+
+def _load_hashes(out_dir):
+    try:
+        with open(os.path.join(out_dir, FIGURE_HASHES)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def _save_hashes(hashes, out_dir):
+    path = os.path.join(out_dir, FIGURE_HASHES)
+    with open(f"{path}.{os.getpid()}.tmp", 'w') as f:
+        json.dump(hashes, f, indent=1, sort_keys=True)
+    os.replace(f"{path}.{os.getpid()}.tmp", path)
+
+@instrumented
+def render_figures(figures, out_dir='.', max_workers=None):
+    """
+    Saves the figures to out_dir, skipping those whose file is there with the same inputs as last time.
+    Figures are drawn in max_workers processes (one per core by default). Returns the paths drawn.
+    """
+
+    os.makedirs(out_dir, exist_ok=True)
+    hashes = _load_hashes(out_dir)
+    digests = {figure.filename: figure.digest() for figure in figures}
+    stale = [figure for figure in figures if hashes.get(figure.filename) != digests[figure.filename]
+             or not os.path.exists(os.path.join(out_dir, figure.filename))]
+
+    if len(stale) > 1 and max_workers != 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            paths = list(pool.map(_render, stale, [out_dir] * len(stale)))
+    else:
+        paths = [_render(figure, out_dir) for figure in stale]
+
+    hashes.update({figure.filename: digests[figure.filename] for figure in stale})
+    _save_hashes(hashes, out_dir)
+    return paths
+
+def _draw_daily_traffic(plt, sns, data, stations):
+    #each station's series is split off once rather than masked out of the table for every station
+    by_station = dict(list(data.groupby('station_id', sort=False)))
+    #the axes exist even when none of the stations has data between start and end
+    time_plot = plt.gca()
+    for sta in stations:
+        if sta in by_station:
+            sns.lineplot(x=by_station[sta].date, y=by_station[sta].daily_entries, label=by_station[sta].station.iloc[0], ax=time_plot);
+
+    if time_plot.lines:
+        time_plot.legend(loc=3, fontsize='10', shadow=True);
+    time_plot.set_title('Determing High Traffic Stations By Daily Traffic', fontsize=12)
+    time_plot.set_ylabel('Daily Entries', fontsize=12)
+    time_plot.set_xlabel('Date', fontsize=12);
+    sns.despine()
+
+def daily_traffic_figure(daily, stations, start='2019-04-01', end='2019-04-29'):
+    """
+    Daily entries of each station (by station_id, labelled by name) between start and end
+    (April only by default to more cleanly visualize patterns).
+    """
+
+    daily = daily[daily.station_id.isin(stations)]
+    daily = daily.assign(station=daily.station.astype(str), date=daily.datetime.dt.normalize())
+    daily = daily[(daily.date >= pd.to_datetime(start)) & (daily.date <= pd.to_datetime(end))]
+    grouped_by_station_and_day = daily.groupby(['station_id', 'station', 'date'])['daily_entries'].sum().reset_index()
+
+    return Figure("Apr_Determing_high_traffic_stations_by_daily_traffic.png", _draw_daily_traffic,
+                  grouped_by_station_and_day, (14,5), stations=list(stations))
+
+def _draw_dow_traffic(plt, sns, data, stations):
+    days = ['','Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday','Sunday']
+    by_station = dict(list(data.groupby('station_id', sort=False)))
+    dow_plot = plt.gca()
+    for sta in stations:
+        if sta in by_station:
+            single_station = by_station[sta].sort_values(by='dow_num')
+            sns.lineplot(x=single_station.dow_num, y = single_station.mean_dow_entries, label=single_station.station.iloc[0], ax=dow_plot);
+
+    if dow_plot.lines:
+        dow_plot.legend(fontsize='10', shadow=True, loc=3);
+    dow_plot.set_title('Top Station Traffic by Day of the Week', fontsize=14)
+    dow_plot.set_ylabel('Mean Daily Entries', fontsize=12)
+    dow_plot.set_xlabel('Day of Week', fontsize=12);
+    dow_plot.set_xticks(range(-1, 7))
+    dow_plot.set_xticklabels(labels=days)
+    sns.despine()
+
+def dow_traffic_figure(grp_by_sta_dow, stations):
+    """Mean daily entries by day of week of each station_id in stations (from TrafficCube.dow_profile)."""
+
+    data = grp_by_sta_dow[['station_id', 'station', 'dow_num', 'mean_dow_entries']].astype({'station': str})
+    return Figure("Top_station_traffic_by_day_of_week.png", _draw_dow_traffic, data, (12,5), stations=list(stations))
+
+def _draw_peak_days_by_hour(plt, sns, peak_days):
+    bar_time = sns.barplot(x=peak_days.hour_group, y = peak_days.entries_per_hour_group, hue=peak_days.dow);
+
+    bar_time.legend(fontsize='10', loc=2)
+    bar_time.set_title('High Traffic Station Activity')
+    bar_time.set_ylabel('Mean Entries Per 3 Hour Block')
+    bar_time.set_xlabel('Ending Hour of 3-Hour Block')
+    sns.despine()
+
+def peak_days_by_hour_figure(grp_hourly_dow, days=PEAK_DAYS):
+    """Entries per block of hours for the busiest days of the week (from TrafficCube.hourly_profile)."""
+
+    peak_days = grp_hourly_dow[grp_hourly_dow.dow.isin(days)].astype({'dow': str}).reset_index(drop=True)
+    return Figure("Peak_days_Station_Traffic_By_Hour.png", _draw_peak_days_by_hour, peak_days, (10,4))
+
+def _draw_day_by_hour(plt, sns, single_day, day):
+    bar_time = sns.barplot(x=single_day.hour_group, y = single_day.entries_per_hour_group, color=BRAND_BLUE);
+
+    bar_time.set_title(f'{day} Station Traffic By Hour')
+    bar_time.set_ylabel('Mean Hourly Entries')
+    bar_time.set_xlabel('Hour of The Day')
+    sns.despine()
+
+def day_by_hour_figure(grp_hourly_dow, day='Thursday'):
+    """Entries per block of hours for a single day of the week for simple visualization."""
+
+    single_day = grp_hourly_dow[(grp_hourly_dow.dow == day)][['hour_group', 'entries_per_hour_group']].reset_index(drop=True)
+    return Figure(f"{day}_Station_Traffic_By_Hour.png", _draw_day_by_hour, single_day, (10,4), day=day)
+
+def _draw_census(plt, sns, y, y_ax, graph_title):
+    boroughs = ['NYC (All Boroughs)', 'Bronx', 'Brooklyn', 'Manhattan', 'Queens', 'Staten Island']
+
+    ax = sns.barplot(x=boroughs, y=list(y), color=BRAND_BLUE)
+    ax.set(xlabel='Borough', ylabel=y_ax, title=graph_title);
+    sns.despine()
+
+def census_figure(y, y_ax, graph_title):
+    return Figure(f"{graph_title}.png", _draw_census, y.rename('y'), (10,6), y_ax=y_ax, graph_title=graph_title)
+
+def census_figures(census):
+    """The census features used to pick the boroughs to market in."""
+
+    return [
+        #Visualize Women per Square Mile in the 5 boroughs to compare density of women per borough
+        census_figure(census['perc_female']*census['pop_persqmi'], y_ax='Number of Women', graph_title='Women per Square Mile'),
+
+        # Plot annual income per borough to identify high spenders for marketing efficiency
+        census_figure(census['income_dol'], y_ax='Income', graph_title='Median Annual Income (in dollars)'),
+
+        #Plot Female-Owned Firms per Square Mile
+        census_figure(census['womenfirms']/census['area'], y_ax='Firms', graph_title='Female-Owned Firms per Square Mile'),
+
+        #Plot Homes with Broadband to identify regions with higher emphasis on technology
+        census_figure(census['perc_broadband']*100, y_ax='Percentage of Homes', graph_title='Homes with Broadband'),
+    ]
@@ -0,0 +1,56 @@
+from turnstile.instrument import instrumented
+
+"""
+Ranking of stations by traffic.
+"""
+
+STATION_KEYS = ['station_id', 'station', 'borough']
+
+@instrumented
+def mean_weekly_entries(data):
+    """
+    Mean weekly entries per station, keyed on station_id. data is either the daily dataset or a table
+    of weekly entries (e.g. the station_week cube); rows of the same station and week are added up first.
+    """
+
+    value = 'weekly_entries' if 'weekly_entries' in data.columns else 'daily_entries'
+    weekly = data.groupby(STATION_KEYS + ['week'], observed=True)[value].sum()
+    means = weekly.groupby(level=STATION_KEYS, observed=True).mean()
+    return means.rename('mean_weekly_entries').reset_index()
+
+@instrumented
+def rank_stations(data, n=10, by='borough', areas=None):
+    """
+    Returns the top n stations by mean weekly entries within every group of by (every borough by default)
+    as a tidy table with a rank column, from a single sort of the per-station means.
+    by=None ranks all stations together.
+
+    areas is a table of station_id and a by column (e.g. from turnstile.spatial.station_areas) that
+    replaces the stations' own by column, to rank by the area each station lies in. It is joined onto
+    the per-station means, so stations missing from it are left out.
+    """
+
+    means = mean_weekly_entries(data)
+    if areas is not None and by is not None:
+        means = means.drop(columns=[by], errors='ignore').merge(areas[['station_id', by]], on='station_id')
+    if by is None:
+        ranked = means.sort_values(by='mean_weekly_entries', ascending=False, kind='stable')
+        ranked['rank'] = range(1, len(ranked) + 1)
+    else:
+        ranked = means.sort_values(by=[by, 'mean_weekly_entries'], ascending=[True, False], kind='stable')
+        ranked['rank'] = ranked.groupby(by, observed=True).cumcount() + 1
+    return ranked[ranked['rank'] <= n].reset_index(drop=True)
+
+# which of each borough's top stations the street teams cover, in borough priority order
+TOP_STATION_PICKS = {'Bk': slice(1, 2), #row zero is an error due to matching station names in manhattan and brooklyn. Removed after outside research.
+                     'M': slice(0, 7),
+                     'Q': slice(0, 2)}
+
+def select_top_stations(ranked, picks=TOP_STATION_PICKS):
+    """Takes the ranked stations table and returns the station_ids of the picks[borough] slice of each borough's ranking."""
+
+    top_sta_list = []
+    for borough, pick in picks.items():
+        top_stations = ranked[ranked.borough == borough].sort_values(by='rank')
+        top_sta_list += list(top_stations.station_id[pick])
+    return top_sta_list
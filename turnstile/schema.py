@@ -0,0 +1,106 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+
+"""
+Declared schema of the weekly MTA turnstile files.
+
+The identifier columns repeat the same few thousand values millions of times, so they
+are read as categoricals. The ENTRIES and EXITS registers are 32-bit counters and fit in
+uint32. DATE and TIME are typed as a date and a time of day, and the audit timestamp
+DATETIME is computed from them in one vectorized step.
+
+Files are read with pyarrow's multithreaded CSV reader into an Arrow table with the declared
+types (read_turnstile_table), which then converts to pandas without copying the numeric columns.
+pandas' reader, parsing DATE and TIME once per distinct value, can be picked instead to compare
+the two; pyarrow is required either way, as the store is Parquet.
+"""
+
+TURNSTILE_COLUMNS = ['C/A', 'UNIT', 'SCP', 'STATION', 'LINENAME', 'DIVISION',
+                     'DATE', 'TIME', 'DESC', 'ENTRIES', 'EXITS']
+
+TURNSTILE_DTYPES = {'C/A': 'category',
+                    'UNIT': 'category',
+                    'SCP': 'category',
+                    'STATION': 'category',
+                    'LINENAME': 'category',
+                    'DIVISION': 'category',
+                    'DATE': 'category',
+                    'TIME': 'category',
+                    'DESC': 'category',
+                    'ENTRIES': 'uint32',
+                    'EXITS': 'uint32'}
+
+DATE_FORMAT = "%m/%d/%Y"
+
+def arrow_schema():
+    """Arrow types of the turnstile columns: dictionary-encoded strings for the categoricals."""
+
+    types = {col: pa.dictionary(pa.int32(), pa.string()) for col, dtype in TURNSTILE_DTYPES.items() if dtype == 'category'}
+    types.update({'DATE': pa.timestamp('us'), 'TIME': pa.time32('s'), 'ENTRIES': pa.uint32(), 'EXITS': pa.uint32()})
+    return types
+
+def read_turnstile_table(path):
+    """
+    Reads a weekly turnstile file into an Arrow table with pyarrow's multithreaded CSV reader.
+    DATE is a timestamp, TIME a duration since midnight, and DATETIME = DATE + TIME.
+    """
+
+    # the header of the published files carries trailing whitespace, so the names are declared
+    read_options = pa_csv.ReadOptions(column_names=TURNSTILE_COLUMNS, skip_rows=1, use_threads=True)
+    convert_options = pa_csv.ConvertOptions(column_types=arrow_schema(), timestamp_parsers=[DATE_FORMAT])
+    table = pa_csv.read_csv(path, read_options=read_options, convert_options=convert_options)
+
+    seconds = pc.cast(pc.cast(table['TIME'], pa.int32()), pa.int64())
+    time = pc.cast(pc.multiply(seconds, 10**6), pa.duration('us'))
+    table = table.set_column(TURNSTILE_COLUMNS.index('TIME'), 'TIME', time)
+    return table.append_column('DATETIME', pc.add(table['DATE'], time))
+
+def read_turnstile(path, engine=None):
+    """
+    Reads a weekly turnstile file with the declared schema into a DataFrame. DATE is returned as
+    datetime64, TIME as a timedelta since midnight and DATETIME as the audit timestamp.
+    engine is 'pyarrow' (the default) or 'pandas'.
+    """
+
+    if engine in (None, 'pyarrow'):
+        data = read_turnstile_table(path).to_pandas(split_blocks=True, self_destruct=True)
+        # categories come out in order of appearance; sort them as the pandas reader does
+        for col in data.columns[data.dtypes == 'category']:
+            data[col] = data[col].cat.reorder_categories(data[col].cat.categories.sort_values())
+        return data
+
+    data = pd.read_csv(path, names=TURNSTILE_COLUMNS, header=0, dtype=TURNSTILE_DTYPES)
+    data['DATE'] = _parse_categories(data.DATE, lambda values: pd.to_datetime(values, format=DATE_FORMAT))
+    data['TIME'] = _parse_categories(data.TIME, pd.to_timedelta)
+    data['DATETIME'] = data.DATE + data.TIME
+    return data
+
+def _parse_categories(column, parse):
+    """Parses only the distinct values of a categorical column and broadcasts them back to the rows."""
+
+    parsed = parse(column.cat.categories)
+    codes = column.cat.codes.to_numpy()
+    values = parsed.take(codes)
+    if (codes == -1).any():
+        values = values.where(codes != -1)
+    return pd.Series(values, index=column.index, name=column.name)
+
+def concat_weeks(weeks):
+    """
+    Concatenates weekly frames once, keeping categorical columns categorical by
+    unioning their categories first (a plain concat falls back to object columns).
+    """
+
+    weeks = list(weeks)
+    if not weeks:
+        return pd.DataFrame()
+
+    categorical = [col for col, dtype in weeks[0].dtypes.items() if isinstance(dtype, pd.CategoricalDtype)]
+    for col in categorical:
+        categories = pd.api.types.union_categoricals([week[col] for week in weeks], ignore_order=True).categories
+        for week in weeks:
+            week[col] = week[col].cat.set_categories(categories)
+
+    return pd.concat(weeks, ignore_index=True)
@@ -0,0 +1,174 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from turnstile.instrument import instrumented
+
+"""
+Spatial lookups on the station coordinates of Stations.csv (GTFS latitude/longitude), with NumPy only.
+
+StationIndex buckets the stations into a grid of square cells (500 m by default). Radius queries
+only compute distances to the stations of the cells around each query point, and polygons (boroughs,
+census tracts, ... read from a local GeoJSON file) are only tested against the stations of the cells
+under their bounding box. Both work on whole batches of points and polygons at once.
+"""
+
+EARTH_RADIUS_M = 6_371_008.8
+GRID_CELL_M = 500
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in metres between points given in degrees (element-wise on arrays)."""
+
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(value, dtype=np.float64)) for value in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+@instrumented
+def load_polygons(path, name_property):
+    """
+    Reads the Polygon and MultiPolygon features of a GeoJSON file as a list of (name, rings), with name
+    the name_property of the feature and rings arrays of (lon, lat) vertices, the exterior first and then
+    the holes. A MultiPolygon gives one entry per polygon.
+    """
+
+    with open(path) as f:
+        features = json.load(f)['features']
+
+    polygons = []
+    for feature in features:
+        geometry = feature['geometry']
+        if geometry is None or geometry['type'] not in ('Polygon', 'MultiPolygon'):
+            continue
+        parts = [geometry['coordinates']] if geometry['type'] == 'Polygon' else geometry['coordinates']
+        for part in parts:
+            rings = [np.asarray(ring, dtype=np.float64)[:, :2] for ring in part]
+            polygons.append((feature['properties'][name_property], rings))
+    return polygons
+
+def points_in_polygon(lats, lons, rings, max_cells=2**22):
+    """
+    Even-odd test of which points lie inside a polygon given as rings of (lon, lat) vertices, crossing
+    every edge with a ray from every point at once (in blocks of points of at most max_cells pairs).
+    """
+
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    inside = np.zeros(len(lats), dtype=bool)
+    for ring in rings:
+        x1, y1 = ring[:, 0], ring[:, 1]
+        x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+        step = max(1, max_cells // len(ring))
+        for start in range(0, len(lats), step):
+            lat = lats[start:start + step, None]
+            lon = lons[start:start + step, None]
+            # edges parallel to the ray never straddle it, so their division by zero is masked out
+            with np.errstate(divide='ignore', invalid='ignore'):
+                crosses = ((y1 > lat) != (y2 > lat)) & (lon < (x2 - x1) * (lat - y1) / (y2 - y1) + x1)
+            inside[start:start + step] ^= crosses.sum(axis=1) % 2 == 1
+    return inside
+
+class StationIndex:
+    """Grid index of station coordinates for batch radius queries and polygon assignment."""
+
+    def __init__(self, stations, cell_m=GRID_CELL_M):
+        """stations is a table with gtfs_latitude and gtfs_longitude columns (e.g. the cleaned Stations.csv)."""
+
+        self.stations = stations.dropna(subset=['gtfs_latitude', 'gtfs_longitude']).reset_index(drop=True)
+        self.lats = self.stations.gtfs_latitude.to_numpy(dtype=np.float64)
+        self.lons = self.stations.gtfs_longitude.to_numpy(dtype=np.float64)
+        self.cell_m = cell_m
+
+        # cells are laid out on an equirectangular projection around the mean latitude of the stations
+        self.cos_lat0 = np.cos(np.radians(self.lats.mean())) if len(self.lats) else 1.0
+        ix, iy = self._cells(self.lats, self.lons)
+        self.ix0, self.iy0 = (ix.min(), iy.min()) if len(ix) else (0, 0)
+        self.nx, self.ny = (ix.max() - self.ix0 + 1, iy.max() - self.iy0 + 1) if len(ix) else (0, 0)
+        keys = (ix - self.ix0) * self.ny + (iy - self.iy0)
+        self.order = np.argsort(keys, kind='stable')
+        self.keys = keys[self.order]
+
+    def _cells(self, lats, lons):
+        x = EARTH_RADIUS_M * np.radians(lons) * self.cos_lat0
+        y = EARTH_RADIUS_M * np.radians(lats)
+        return np.floor(x / self.cell_m).astype(np.int64), np.floor(y / self.cell_m).astype(np.int64)
+
+    def _stations_in_cells(self, cx, cy):
+        """Returns (i, position) pairs of the stations (positions in self.stations) in the cells cx[i], cy[i]."""
+
+        valid = (cx >= 0) & (cx < self.nx) & (cy >= 0) & (cy < self.ny)
+        keys = cx * self.ny + cy
+        lows = np.searchsorted(self.keys, keys, side='left')
+        counts = np.where(valid, np.searchsorted(self.keys, keys, side='right') - lows, 0)
+        cells = np.repeat(np.arange(len(keys)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return cells, self.order[lows[cells] + offsets]
+
+    @instrumented
+    def within(self, lats, lons, radius_m):
+        """
+        Returns the stations within radius_m metres of each point as a table of the point's position in
+        lats/lons (query), the station's columns and distance_m, sorted by query and distance.
+        """
+
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        lons = np.atleast_1d(np.asarray(lons, dtype=np.float64))
+        qx, qy = self._cells(lats, lons)
+
+        # the projection stretches east-west distances by up to cos(lat0) / cos(lat), so look that much further
+        stretch = max(1.0, self.cos_lat0 / np.cos(np.radians(np.abs(np.concatenate([lats, self.lats])))).min())
+        reach = int(np.ceil(radius_m * stretch * 1.001 / self.cell_m))
+
+        queries, positions = [], []
+        for dx in range(-reach, reach + 1):
+            for dy in range(-reach, reach + 1):
+                cells, found = self._stations_in_cells(qx - self.ix0 + dx, qy - self.iy0 + dy)
+                queries.append(cells)
+                positions.append(found)
+        queries = np.concatenate(queries)
+        positions = np.concatenate(positions)
+
+        distances = haversine_m(lats[queries], lons[queries], self.lats[positions], self.lons[positions])
+        near = distances <= radius_m
+        result = self.stations.take(positions[near]).reset_index(drop=True)
+        result.insert(0, 'query', queries[near])
+        result['distance_m'] = distances[near]
+        return result.sort_values(by=['query', 'distance_m'], kind='stable').reset_index(drop=True)
+
+    def in_box(self, min_lat, max_lat, min_lon, max_lon):
+        """Returns the positions (in self.stations) of the stations inside a latitude/longitude box."""
+
+        (x0, x1), (y0, y1) = self._cells(np.array([min_lat, max_lat]), np.array([min_lon, max_lon]))
+        cx, cy = np.meshgrid(np.arange(x0, x1 + 1) - self.ix0, np.arange(y0, y1 + 1) - self.iy0, indexing='ij')
+        _, positions = self._stations_in_cells(cx.ravel(), cy.ravel())
+        inside = (self.lats[positions] >= min_lat) & (self.lats[positions] <= max_lat) & \
+                 (self.lons[positions] >= min_lon) & (self.lons[positions] <= max_lon)
+        return np.sort(positions[inside])
+
+    @instrumented
+    def assign(self, polygons):
+        """
+        Returns the name of the polygon (see load_polygons) every station lies in, or None, in the order of
+        self.stations. A station inside several polygons gets the first of them.
+        """
+
+        names = np.full(len(self.stations), None, dtype=object)
+        for name, rings in polygons:
+            lons, lats = rings[0][:, 0], rings[0][:, 1]
+            candidates = self.in_box(lats.min(), lats.max(), lons.min(), lons.max())
+            candidates = candidates[pd.isna(names[candidates])]
+            inside = points_in_polygon(self.lats[candidates], self.lons[candidates], rings)
+            names[candidates[inside]] = name
+        return names
+
+@instrumented
+def station_areas(stations, path, name_property, column='area', cell_m=GRID_CELL_M):
+    """
+    Assigns the stations of a table with station_id and GTFS coordinates to the polygons of a GeoJSON
+    file (named by their name_property) and returns station_id and column, e.g. to rank stations by
+    area with rank_stations(..., by=column, areas=...). Stations outside every polygon are left out.
+    """
+
+    index = StationIndex(stations, cell_m=cell_m)
+    areas = pd.DataFrame({'station_id': index.stations.station_id.to_numpy(), column: index.assign(load_polygons(path, name_property))})
+    return areas.dropna(subset=[column]).reset_index(drop=True)
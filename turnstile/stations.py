@@ -0,0 +1,306 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from turnstile.instrument import instrumented
+
+"""
+Subway location data and the station name adjustments needed to merge it with the turnstile data.
+"""
+
+STATIONS_URL = 'http://web.mta.info/developers/data/nyct/subway/Stations.csv'
+
+#several of the names in the datasets are not consistent. Adjustments are made to the datasets prior to merging.
+#replace the string naming of mta.station to match that of location.stop_name
+MTA_STATION_RENAMES = {"4AV-9 ST":"4 AV-9 ST",
+                       'TWENTY THIRD ST':'23 ST',
+                       'THIRTY THIRD ST':'33 ST'}
+
+#regex replacements applied to location.stop_name before the literal renames below
+STOP_NAME_PATTERNS = {" - ":"-",
+                      "CENTER":"CTR",
+                      "SQ-E TREMONT AV":"SQ",
+                      " UNIVERSITY":"",
+                      "PLAZA":"PZ",
+                      "COLLEGE":"COL",
+                      "STATION":"STA"}
+
+#replace the string naming of location.stop_name to match that of mta.station
+STOP_NAME_RENAMES = {"103 ST-CORONA PZ":"103 ST-CORONA",
+                     "137 ST-CITY COL":"137 ST CITY COL",
+                     "138 ST-GRAND CONCOURSE":"138/GRAND CONC",
+                     "149 ST-GRAND CONCOURSE":"149/GRAND CONC",
+                     "15 ST-PROSPECT PK":"15 ST-PROSPECT",
+                     "161 ST-YANKEE STADIUM":"161/YANKEE STAD",
+                     "163 ST-AMSTERDAM AV":"163 ST-AMSTERDM",
+                     "21 ST-QUEENSBRIDGE":"21 ST-QNSBRIDGE",
+                     "3 AV-138 ST":"3 AV 138 ST",
+                     "40 ST":"40 ST LOWERY ST",
+                     "42 ST-PORT AUTHORITY BUS TERMINAL":"42 ST-PORT AUTH",
+                     "5 AV":"5 AVE",
+                     "59 ST-COLUMBUS CIRCLE":"59 ST COLUMBUS",
+                     "66 ST-LINCOLN CTR":"66 ST-LINCOLN",
+                     "68 ST-HUNTER COL":"68ST-HUNTER CO",
+                     "75 ST":"75 ST-ELDERTS",
+                     "81 ST-MUSEUM OF NATURAL HISTORY":"81 ST-MUSEUM",
+                     "82 ST-JACKSON HTS":"82 ST-JACKSON H",
+                     "85 ST-FOREST PKWY":"85 ST-FOREST PK",
+                     "90 ST-ELMHURST AV":"90 ST-ELMHURST",
+                     "9 ST":"9TH STREET",
+                     "AQUEDUCT-N CONDUIT AV":"AQUEDUCT N.COND",
+                     "AQUEDUCT RACETRACK":"AQUEDUCT RACETR",
+                     "ASTORIA-DITMARS BLVD":"ASTORIA DITMARS",
+                     'ATLANTIC AV-BARCLAYS CTR':'ATL AV-BARCLAY',
+                     'BEDFORD-NOSTRAND AVS':'BEDFORD-NOSTRAN',
+                     'BEVERLEY RD':'BEVERLEY ROAD',
+                     'BRIARWOOD-VAN WYCK BLVD':'BRIARWOOD',
+                     'BROADWAY-LAFAYETTE ST':"B'WAY-LAFAYETTE",
+                     '15 ST-PROSPECT PARK':'15 ST-PROSPECT',
+                     '47-50 STS CTR':'47-50 STS ROCK',
+                     'BEDFORD PARK BLVD':'BEDFORD PK BLVD',
+                     'BROOKLYN BRIDGE-CITY HALL':'BROOKLYN BRIDGE',
+                     'BUSHWICK AV-ABERDEEN ST':'BUSHWICK AV',
+                     'CANARSIE-ROCKAWAY PKWY':'CANARSIE-ROCKAW',
+                     'CENTRAL PARK NORTH (110 ST)':'CENTRAL PK N110',
+                     'CHRISTOPHER ST-SHERIDAN SQ':'CHRISTOPHER ST',
+                     'CLINTON-WASHINGTON AVS':'CLINTON-WASH AV',
+                     'CONEY ISLAND-STILLWELL AV':'CONEY IS-STILLW',
+                     'COURT ST':'COURT SQ-23 ST',
+                     'CROWN HTS-UTICA AV':'CROWN HTS-UTICA',
+                     'DELANCEY ST':'CROWN HTS-UTICA',
+                     'E 105 ST':'EAST 105 ST',
+                     "E 143 ST-ST MARY'S ST":"E 143/ST MARY'S",
+                     'EASTCHESTER-DYRE AV':'EASTCHSTER/DYRE',
+                     'EASTERN PKWY-BROOKLYN MUSEUM':'EASTN PKWY-MUSM',
+                     'FAR ROCKAWAY-MOTT AV': 'FAR ROCKAWAY',
+                     'FLATBUSH AV-BROOKLYN COL':'FLATBUSH AV-B.C',
+                     'FLUSHING-MAIN ST':'FLUSHING-MAIN',
+                     'FOREST AV':'FOREST AVE',
+                     'FOREST HILLS-71 AV':'FOREST HILLS 71',
+                     'FORT HAMILTON PKWY': 'FT HAMILTON PKY',
+                     'GRAND ARMY PZ':'GRAND ARMY PLAZ',
+                     'GRAND AV-NEWTOWN':'GRAND-NEWTOWN',
+                     'GRAND CENTRAL-42 ST':'GRD CNTRL-42 ST',
+                     'HARLEM-148 ST':'HARLEM 148 ST',
+                     'HOWARD BEACH-JFK AIRPORT':'HOWARD BCH JFK',
+                     'HOYT-SCHERMERHORN STS':'HOYT-SCHER',
+                     'HUNTERS POINT AV':'HUNTERS PT AV',
+                     'JAMAICA CTR-PARSONS/ARCHER':'JAMAICA CENTER',
+                     'JAMAICA-179 ST':'JAMAICA 179 ST',
+                     'JAMAICA-VAN WYCK':'JAMAICA VAN WK',
+                     'JAY ST-METROTECH':'JAY ST-METROTEC',
+                     'KEW GARDENS-UNION TPKE':'KEW GARDENS',
+                     'KINGSTON-THROOP AVS':'KINGSTON-THROOP',
+                     'KNICKERBOCKER AV':'KNICKERBOCKER',
+                     'LEXINGTON AV/53 ST':'LEXINGTON AV/53',
+                     'LEXINGTON AV/63 ST':'LEXINGTON AV/63',
+                     'MARBLE HILL-225 ST':'MARBLE HILL-225',
+                     'METS-WILLETS POINT':'METS-WILLETS PT',
+                     'MORRISON AV- SOUND VIEW':'MORISN AV/SNDVW',
+                     'MYRTLE-WILLOUGHBY AVS': 'MYRTLE-WILLOUGH',
+                     'MYRTLE-WYCKOFF AVS':'MYRTLE-WYCKOFF',
+                     'NORWOOD-205 ST': 'NORWOOD 205 ST',
+                     'OZONE PARK-LEFFERTS BLVD':'OZONE PK LEFFRT',
+                     'PARK PL': 'PARK PLACE',
+                     'QUEENS PZ':'QUEENS PLAZA',
+                     'ROCKAWAY PARK-BEACH 116 ST':'ROCKAWAY PARK B',
+                     'ROOSEVELT ISLAND':'ROOSEVELT ISLND',
+                     'SENECA AV':'SENECA AVE',
+                     'SMITH-9 STS':'SMITH-9 ST',
+                     'ST GEORGE':'ST. GEORGE',
+                     'VAN CORTLANDT PARK-242 ST':'V.CORTLANDT PK',
+                     'VERNON BLVD-JACKSON AV':'VERNON-JACKSON',
+                     'W 4 ST':'W 4 ST-WASH SQ',
+                     'W 8 ST-NY AQUARIUM':'W 8 ST-AQUARIUM',
+                     'WAKEFIELD-241 ST':'WAKEFIELD/241',
+                     'WTC CORTLANDT':'WTC-CORTLANDT',
+                     '4 AV':'4 AV-9 ST',
+                     'ESSEX ST':'DELANCEY/ESSEX',
+                     'JACKSON HTS-ROOSEVELT AV':'JKSN HT-ROOSVLT',
+                     'NEWKIRK PZ':'NEWKIRK PLAZA',
+                     'QUEENSBORO PZ':'QUEENSBORO PLZ',
+                     'SUTPHIN BLVD-ARCHER AV-JFK AIRPORT':'SUTPHIN-ARCHER',
+                     'SUTTER AV-RUTLAND RD':'SUTTER AV-RUTLD',
+                     'UNION SQ-14 ST':'14TH STREET',
+                     'WHITEHALL ST':'WHITEHALL S-FRY',
+                     'WOODSIDE-61 ST':'61 ST WOODSIDE',
+                     '34 ST-11 AV':'34 ST-HUDSON YD',
+                     'JAMAICA CTR':'JAMAICA CENTER',
+                     '47-50 STS-ROCKEFELLER CTR':'47-50 STS ROCK',
+                     'WEST FARMS SQ-E TREMONT AV':'WEST FARMS SQ',
+                     'WESTCHESTER SQ-E TREMONT AV':'WESTCHESTER SQ'}
+
+@instrumented
+def import_location_data(path=STATIONS_URL):
+    return pd.read_csv(path)
+
+@instrumented
+def clean_location_data(data):
+    data.columns = data.columns.str.strip().str.lower().str.replace('/',"_").str.replace(' ', '_')
+    data['stop_name'] = data.stop_name.str.upper().str.strip()
+
+    return data
+
+class StationNameResolver:
+    """
+    Compiles a set of name adjustments once and applies them to the distinct names of a
+    categorical column, so the work scales with the number of station names rather than rows.
+
+    patterns are regular expressions applied in order, then renames are literal replacements.
+    conflicts lists the targets that more than one source name is renamed to.
+    """
+
+    def __init__(self, renames, patterns=None):
+        self.patterns = [(re.compile(pattern), repl) for pattern, repl in (patterns or {}).items()]
+        self.renames = dict(renames)
+
+        sources = {}
+        for source, target in self.renames.items():
+            sources.setdefault(target, []).append(source)
+        self.conflicts = {target: names for target, names in sources.items() if len(names) > 1}
+
+    def resolve(self, name):
+        """Returns the adjusted spelling of a single name."""
+
+        for pattern, repl in self.patterns:
+            name = pattern.sub(repl, name)
+        return self.renames.get(name, name)
+
+    def apply(self, names):
+        """Returns names (any Series of strings) as a categorical Series with the adjustments applied."""
+
+        names = names.astype('category')
+        resolved = pd.Index([self.resolve(name) for name in names.cat.categories])
+
+        # several old names can resolve to the same new one, so the categories are rebuilt from the codes
+        new_codes, new_categories = pd.factorize(resolved)
+        codes = names.cat.codes.to_numpy()
+        codes = np.where(codes == -1, -1, new_codes.take(codes))
+        return pd.Series(pd.Categorical.from_codes(codes, new_categories), index=names.index, name=names.name)
+
+MTA_STATION_RESOLVER = StationNameResolver(MTA_STATION_RENAMES)
+STOP_NAME_RESOLVER = StationNameResolver(STOP_NAME_RENAMES, patterns=STOP_NAME_PATTERNS)
+
+@instrumented
+def normalize_mta_station_names(mta):
+    """Renames turnstile station names that are spelled differently from the location data."""
+
+    mta['station'] = MTA_STATION_RESOLVER.apply(mta.station)
+    return mta
+
+@instrumented
+def normalize_stop_names(locations):
+    """Renames location stop names to match the spelling used in the turnstile data."""
+
+    locations['stop_name'] = STOP_NAME_RESOLVER.apply(locations.stop_name)
+    return locations
+
+def unmatched_stations(mta, locations):
+    """
+    Returns the (station, division) pairs of the turnstile data that have no stop in the
+    location data, with the number of readings for each. These rows are dropped by the merge.
+    """
+
+    pairs = mta.groupby(['station', 'division'], observed=True).size().rename('readings').reset_index()
+    stops = pd.MultiIndex.from_arrays([locations.stop_name.astype(str), locations.division.astype(str)])
+    matched = pd.MultiIndex.from_arrays([pairs.station.astype(str), pairs.division.astype(str)]).isin(stops)
+    return pairs[~matched].sort_values(by='readings', ascending=False).reset_index(drop=True)
+
+@instrumented
+def report_station_names(mta, locations):
+    """Prints the rename conflicts and the turnstile stations that will not find a location."""
+
+    for resolver in (MTA_STATION_RESOLVER, STOP_NAME_RESOLVER):
+        for target, sources in resolver.conflicts.items():
+            print(f"Check: {' and '.join(sources)} are all renamed to {target}.")
+
+    unmatched = unmatched_stations(mta, locations)
+    if len(unmatched):
+        print(f"{len(unmatched)} stations ({unmatched.readings.sum()} readings) have no match in the location data:")
+        print(unmatched.to_string(index=False))
+
+    return unmatched
+
+def station_subset(data, stations, column='station'):
+    """
+    Returns the rows of data whose station is in stations, for any number of stations.
+    On a categorical column the wanted categories are marked once and rows are selected by code,
+    otherwise a single hashed membership test is used.
+    """
+
+    col = data[column]
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        wanted = col.cat.categories.get_indexer(list(stations))
+        # the extra slot at the end is looked up by missing values (code -1)
+        keep = np.zeros(len(col.cat.categories) + 1, dtype=bool)
+        keep[wanted[wanted >= 0]] = True
+        mask = keep[col.cat.codes.to_numpy()]
+    else:
+        mask = col.isin(list(stations)).to_numpy()
+    return data[mask]
+
+def station_filter(stations, column='station'):
+    """Returns a read_table filter that pushes a station subset down into the storage read."""
+
+    return [(column, 'in', list(stations))]
+
+STATION_COLUMNS = ['station_id', 'stop_name', 'division', 'borough', 'gtfs_latitude', 'gtfs_longitude']
+
+@instrumented
+def build_station_dimension(locations, on_duplicate='first'):
+    """
+    Builds the station dimension table from the cleaned location data: one row per
+    (stop_name, division) with the integer station_id from Stations.csv, borough and coordinates.
+
+    Stations.csv can list the same stop name more than once within a division. Merging on such
+    a name would duplicate turnstile rows, so duplicates are reported and only the first stop is
+    kept, or a ValueError is raised when on_duplicate='raise'.
+    """
+
+    stations = locations[STATION_COLUMNS].copy()
+    stations['stop_name'] = stations.stop_name.astype(str)
+    stations['division'] = stations.division.astype(str)
+
+    duplicated = stations.duplicated(subset=['stop_name', 'division'], keep=False)
+    if duplicated.any():
+        duplicates = stations[duplicated].sort_values(by=['stop_name', 'division'])
+        if on_duplicate == 'raise':
+            raise ValueError(f"Stop names match more than one station:\n{duplicates.to_string(index=False)}")
+        print(f"{duplicated.sum()} stops share a stop name and division. Keeping the first of each:")
+        print(duplicates.to_string(index=False))
+        stations = stations.drop_duplicates(subset=['stop_name', 'division'])
+
+    stations['borough'] = stations.borough.astype('category')
+    return stations.reset_index(drop=True)
+
+@instrumented
+def attach_stations(mta, stations):
+    """
+    Adds station_id, borough and coordinates to every turnstile reading through an index lookup.
+    Only the distinct (station, division) pairs are looked up in the station dimension, and rows are
+    then gathered by position. Readings without a matching station are dropped, as in an inner merge.
+    """
+
+    station_codes, station_names = pd.factorize(mta.station)
+    division_codes, division_names = pd.factorize(mta.division)
+    missing = (station_codes == -1) | (division_codes == -1)
+    pair_codes, pairs = pd.factorize(np.where(missing, 0, station_codes.astype(np.int64) * len(division_names) + division_codes))
+
+    pair_names = pd.MultiIndex.from_arrays([np.asarray(station_names.take(pairs // len(division_names)), dtype=str),
+                                            np.asarray(division_names.take(pairs % len(division_names)), dtype=str)])
+    stops = pd.MultiIndex.from_arrays([stations.stop_name, stations.division])
+    positions = np.where(missing, -1, stops.get_indexer(pair_names).take(pair_codes))
+
+    matched = positions >= 0
+    data = mta[matched].copy()
+    positions = positions[matched]
+    for col in ['station_id', 'borough', 'gtfs_latitude', 'gtfs_longitude']:
+        data[col] = stations[col].take(positions).array
+
+    return data
+
+def merge_locations(mta, locations):
+    """Adds borough and location columns to every turnstile reading."""
+
+    return attach_stations(mta, build_station_dimension(locations))
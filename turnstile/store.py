@@ -0,0 +1,73 @@
+import os
+import shutil
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from turnstile.instrument import instrumented
+
+"""
+Columnar store for the intermediate datasets (merged turnstile/location data, daily and hourly).
+
+Each dataset is a Parquet dataset partitioned by week and borough, so dtypes survive the
+round trip and readers can load only the columns and partitions they need.
+"""
+
+STORE_DIR = 'mta_store'
+PARTITION_COLS = ['week', 'borough']
+
+def table_path(name, root=STORE_DIR):
+    return os.path.join(root, name)
+
+def week_start(dates):
+    """Returns the Saturday that starts the turnstile week of each date, formatted as YYYY-MM-DD."""
+
+    days = dates.dt.normalize()
+    offset = pd.to_timedelta((days.dt.dayofweek - 5) % 7, unit='D')
+    return (days - offset).dt.strftime('%Y-%m-%d')
+
+@instrumented
+def write_table(data, name, root=STORE_DIR, partition_cols=PARTITION_COLS, append=False):
+    """
+    Writes a dataset to the store, adding the week column from datetime when it is missing.
+    Partitions already in the store are replaced by the ones being written, unless append
+    is set, in which case new files are added next to the existing ones. Partitions that are
+    not written to are kept, so a rebuild of a whole dataset should clear_table it first.
+    """
+
+    if 'week' not in data.columns:
+        data = data.assign(week=week_start(data.datetime))
+
+    table = pa.Table.from_pandas(data, preserve_index=False)
+    if append:
+        pq.write_to_dataset(table, table_path(name, root), partition_cols=partition_cols,
+                            existing_data_behavior='overwrite_or_ignore',
+                            basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet")
+    else:
+        pq.write_to_dataset(table, table_path(name, root), partition_cols=partition_cols,
+                            existing_data_behavior='delete_matching')
+
+def clear_table(name, root=STORE_DIR):
+    """Deletes a dataset from the store, before it is rebuilt from scratch."""
+
+    shutil.rmtree(table_path(name, root), ignore_errors=True)
+
+def list_partitions(name, root=STORE_DIR, column='week'):
+    """Returns the values of a top-level partition column present in a dataset, in sorted order."""
+
+    prefix = f"{column}="
+    path = table_path(name, root)
+    if not os.path.isdir(path):
+        return []
+    return sorted(entry[len(prefix):] for entry in os.listdir(path) if entry.startswith(prefix))
+
+@instrumented
+def read_table(name, root=STORE_DIR, columns=None, filters=None):
+    """
+    Reads a dataset from the store. columns restricts the columns that are read and
+    filters (e.g. [('borough', 'in', ['M', 'Bk'])]) is pushed down to skip partitions and row groups.
+    """
+
+    return pd.read_parquet(table_path(name, root), engine='pyarrow', columns=columns, filters=filters)
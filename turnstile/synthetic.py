@@ -0,0 +1,152 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from turnstile.deltas import COUNTER_MODULUS
+from turnstile.fetch import week_key
+from turnstile.schema import DATE_FORMAT, TURNSTILE_COLUMNS
+
+"""
+Deterministic generator of synthetic turnstile data, for benchmarks and offline runs.
+
+The weekly files have the layout of the published turnstile_YYMMDD.txt files and come with a
+matching Stations.csv. Turnstiles audit every 4 hours, some at hours 0, 4, 8, ... and some at
+3, 7, 11, ... of standard time, so the audit hours shift by one with daylight saving time as in
+the real data. Counters keep counting from one week to the next, a share of them start close to
+the 32-bit limit and wrap around, some are reset, and a share of the audits is repeated.
+
+The same parameters and the same weeks always give the same files.
+"""
+
+BOROUGH_SHARES = {'M': .3, 'Bk': .35, 'Q': .17, 'Bx': .15, 'SI': .03}
+DIVISIONS = ['BMT', 'IND', 'IRT']
+LINENAMES = ['NQR', 'ACE', '123', '456', 'BDFM', 'L', 'G', 'JZ', '7']
+
+# share of a day's entries in each 4-hour block starting at midnight, and of a week's days (Monday first)
+BLOCK_SHARES = np.array([.03, .07, .25, .2, .3, .15])
+DAY_SHARES = np.array([1, 1.05, 1.1, 1.1, 1.05, .6, .45]) / 6.35
+
+AUDITS_PER_WEEK = 42
+AUDIT_HOURS = 4
+STANDARD_TIME = 'Etc/GMT+5'
+LOCAL_TIME = 'America/New_York'
+
+class TurnstileGenerator:
+    """
+    Generates weeks of turnstile readings for n_stations stations with devices_per_station
+    turnstiles each. The default size is close to a published week (about 200,000 readings).
+
+    Weeks are generated in order, as the counters of a week carry on from the week before;
+    weeks() and write() start from the first Saturday given.
+    """
+
+    def __init__(self, n_stations=470, devices_per_station=10, seed=0, duplicate_rate=.001,
+                 reset_rate=.002, late_audit_share=.3, rollover_share=.01):
+        self.n_stations = n_stations
+        self.devices_per_station = devices_per_station
+        self.seed = seed
+        self.duplicate_rate = duplicate_rate
+        self.reset_rate = reset_rate
+
+        rng = np.random.default_rng(seed)
+        n_devices = n_stations * devices_per_station
+        self.device_station = np.repeat(np.arange(n_stations), devices_per_station)
+        self.device_offset = np.where(rng.random(n_devices) < late_audit_share, 3, 0)
+        self.device_rate = rng.lognormal(np.log(1500), .6, n_devices)
+        self.start_counters = np.where(rng.random(n_devices) < rollover_share,
+                                       COUNTER_MODULUS - rng.integers(1, 50_000, n_devices),
+                                       rng.integers(0, 2**31, n_devices)).astype(np.int64)
+        self.station_borough = rng.choice(list(BOROUGH_SHARES), n_stations, p=list(BOROUGH_SHARES.values()))
+        self.station_division = rng.choice(DIVISIONS, n_stations)
+        self.station_linename = rng.choice(LINENAMES, n_stations)
+        self.station_coords = np.column_stack([40.55 + .35 * rng.random(n_stations),
+                                               -74.1 + .35 * rng.random(n_stations)])
+
+    def station_names(self):
+        return [f"SYNTHETIC {station:04d} ST" for station in range(self.n_stations)]
+
+    def stations(self):
+        """Returns the stations in the layout of Stations.csv."""
+
+        return pd.DataFrame({'Station ID': np.arange(1, self.n_stations + 1),
+                             'Division': self.station_division,
+                             'Line': self.station_linename,
+                             'Stop Name': [name.title() for name in self.station_names()],
+                             'Borough': self.station_borough,
+                             'GTFS Latitude': self.station_coords[:, 0].round(6),
+                             'GTFS Longitude': self.station_coords[:, 1].round(6)})
+
+    def week(self, saturday, counters):
+        """
+        Returns the readings of the week published on saturday (MM/DD/YYYY), counting on from counters
+        (one per device), together with the counters at the end of the week.
+        """
+
+        rng = np.random.default_rng([self.seed, int(week_key(saturday))])
+        n_devices = len(counters)
+
+        # audits in standard time, shown in local time so that the hours shift with daylight saving time
+        week_start = pd.Timestamp(saturday) - pd.Timedelta(days=7)
+        hours = self.device_offset[:, None] + AUDIT_HOURS * np.arange(AUDITS_PER_WEEK)[None, :]
+        standard = week_start + pd.to_timedelta(hours.ravel(), unit='h')
+        local = pd.DatetimeIndex(standard).tz_localize(STANDARD_TIME).tz_convert(LOCAL_TIME).tz_localize(None)
+
+        # entries since the previous audit: the device's daily rate spread over the blocks of the day and week
+        block = (hours // AUDIT_HOURS) % len(BLOCK_SHARES)
+        day = (week_start.dayofweek + hours // 24) % 7
+        expected = self.device_rate[:, None] * 7 * DAY_SHARES[day] * BLOCK_SHARES[block]
+        increments = rng.poisson(expected)
+        entries = counters[:, None] + np.cumsum(increments, axis=1)
+
+        # a reset sets the counter to a small value, which it counts on from
+        reset = rng.random(n_devices) < self.reset_rate
+        for device in np.flatnonzero(reset):
+            audit = rng.integers(AUDITS_PER_WEEK)
+            entries[device, audit:] += rng.integers(0, 1000) - entries[device, audit]
+        end_counters = entries[:, -1].copy()
+
+        station = self.device_station.repeat(AUDITS_PER_WEEK)
+        device = np.arange(n_devices) % self.devices_per_station
+        names = np.array(self.station_names(), dtype=object)
+        timestamps = pd.Categorical(local)
+        data = pd.DataFrame({'C/A': pd.Categorical([f"A{s:03d}" for s in range(self.n_stations)]).take(station),
+                             'UNIT': pd.Categorical([f"R{s:03d}" for s in range(self.n_stations)]).take(station),
+                             'SCP': pd.Categorical([f"{d // 4:02d}-00-{d % 4:02d}" for d in device]).repeat(AUDITS_PER_WEEK),
+                             'STATION': names.take(station),
+                             'LINENAME': self.station_linename.take(station),
+                             'DIVISION': self.station_division.take(station),
+                             'DATE': timestamps.categories.strftime(DATE_FORMAT).to_numpy().take(timestamps.codes),
+                             'TIME': timestamps.categories.strftime('%H:%M:%S').to_numpy().take(timestamps.codes),
+                             'DESC': 'REGULAR',
+                             'ENTRIES': (entries.ravel() % COUNTER_MODULUS).astype(np.uint32),
+                             'EXITS': ((entries.ravel() * .8) % COUNTER_MODULUS).astype(np.uint32)})
+
+        # repeated audits come right after the original, as recovered audits
+        repeated = np.flatnonzero(rng.random(len(data)) < self.duplicate_rate)
+        duplicates = data.iloc[repeated].assign(DESC='RECOVR AUD')
+        order = np.argsort(np.concatenate([np.arange(len(data)), repeated]), kind='stable')
+        data = pd.concat([data, duplicates], ignore_index=True).take(order).reset_index(drop=True)
+
+        return data, end_counters
+
+    def weeks(self, saturday_list):
+        """Yields (saturday, readings) for every week of saturday_list, in order."""
+
+        counters = self.start_counters
+        for saturday in saturday_list:
+            data, counters = self.week(saturday, counters)
+            yield saturday, data
+
+    def write(self, directory, saturday_list):
+        """Writes Stations.csv and a turnstile_YYMMDD.txt file per week to directory (see LocalDirectorySource)."""
+
+        os.makedirs(directory, exist_ok=True)
+        self.stations().to_csv(os.path.join(directory, 'Stations.csv'), index=False)
+        for saturday, data in self.weeks(saturday_list):
+            # the published files pad the last column name with spaces and the counters with zeros
+            data = data.astype({'ENTRIES': str, 'EXITS': str})
+            data['ENTRIES'] = data.ENTRIES.str.zfill(10)
+            data['EXITS'] = data.EXITS.str.zfill(10)
+            data.to_csv(os.path.join(directory, f"turnstile_{week_key(saturday)}.txt"), index=False,
+                        header=TURNSTILE_COLUMNS[:-1] + [TURNSTILE_COLUMNS[-1].ljust(64)])